@@ -2,33 +2,495 @@
 # directly influences its decision making process. Relevant class functions such as
 # creating children for nodes are added here.
 
-import itertools
+from array import array
 from enum import Enum
 
 class Tactic(Enum):
 	SURVIVAL = 1
 	PILL = 2
 	GHOST = 3
+
+NO_NODE = -1
+
+# Smallest statistics scale before the stored statistics are renormalized
+MIN_SCALE = 1e-100
+
+def tactic_value(best_means, tactic):
+    # Combine (survival, pill, ghost) mean rewards into the value of a tactic
+    survival, pill, ghost = best_means
+    if tactic == Tactic.GHOST:
+        return ghost * survival
+    elif tactic == Tactic.PILL:
+        return pill * survival
+    elif tactic == Tactic.SURVIVAL:
+        return survival
+
+class NodePool():
+    """
+    Struct-of-arrays storage for every node of a search tree.
+
+    Each node is an integer index into a set of typed columns instead of its own
+    Python object, so expanding the tree only appends a few numbers. Children are
+    kept as a linked list (first_child / next_sibling, with last_child so that
+    children keep their insertion order). Edge action sequences are interned and
+    referenced by id.
+
+    Every node also caches the best (survival, pill, ghost) mean rewards of its
+    children, which update() keeps current as playout results are added.
+
+    Discounting is lazy. Stored visits and rewards are in units of a pool-wide
+    scale factor, so apply_discount() only shrinks the scale instead of touching
+    every node, and mean rewards are unaffected by it. Ghost rewards are reset by
+    every discount; a node whose ghost_epoch is older than the pool's epoch has a
+    ghost reward (and best child ghost mean) of 0.
+
+    Nodes that are cut off from the tree are not freed individually; compact()
+    copies the live tree into fresh columns once enough garbage has built up.
+    """
+
+    LINK_COLUMNS = ('parent', 'first_child', 'last_child', 'next_sibling')
+    DATA_COLUMNS = ('visits', 'survival', 'pill', 'ghost', 'ghost_epoch', 'best_survival', 'best_pill', 'best_ghost', 'visited', 'x', 'y', 'actions')
+
+    def __init__(self):
+        self.action_seqs = [None]
+        self.action_ids = {}
+        self.clear()
+
+    def clear(self):
+        # Tree links
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.last_child = array('i')
+        self.next_sibling = array('i')
+        # Statistics
+        self.visits = array('d')
+        self.survival = array('d')
+        self.pill = array('d')
+        self.ghost = array('d')
+        self.ghost_epoch = array('i')
+        # Best mean rewards of the children, valid when visited is set
+        self.best_survival = array('d')
+        self.best_pill = array('d')
+        self.best_ghost = array('d')
+        self.visited = array('b')
+        # Junction position and the id of the action sequence leading to it
+        self.x = array('i')
+        self.y = array('i')
+        self.actions = array('i')
+        self.compacted_size = 0
+        # Statistics are stored divided by scale, so new results are added in units of 1/scale
+        self.scale = 1.
+        self.unit = 1.
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.parent)
+
+    def new_node(self, position=None, actions=None):
+        # Append a detached node and return its index
+        index = len(self.parent)
+        self.parent.append(NO_NODE)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.visits.append(0.)
+        self.survival.append(0.)
+        self.pill.append(0.)
+        self.ghost.append(0.)
+        self.ghost_epoch.append(self.epoch)
+        self.best_survival.append(0.)
+        self.best_pill.append(0.)
+        self.best_ghost.append(0.)
+        self.visited.append(0)
+        if position is None:
+            self.x.append(NO_NODE)
+            self.y.append(NO_NODE)
+        else:
+            self.x.append(position[0])
+            self.y.append(position[1])
+        self.actions.append(self.action_id(actions))
+        return index
+
+    def node(self, index):
+        return MCTNode(pool=self, index=index)
+
+    def action_id(self, actions):
+        # Intern an action sequence; 0 is reserved for "no actions"
+        if actions is None:
+            return 0
+        key = tuple(actions)
+        action_id = self.action_ids.get(key)
+        if action_id is None:
+            action_id = len(self.action_seqs)
+            self.action_seqs.append(actions)
+            self.action_ids[key] = action_id
+        return action_id
+
+    def position(self, index):
+        x = self.x[index]
+        if x == NO_NODE:
+            return None
+        return (x, self.y[index])
+
+    def children(self, index):
+        # Return the indices of the children of a node, in insertion order
+        children = []
+        child = self.first_child[index]
+        while child != NO_NODE:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def add_child(self, index, child):
+        last = self.last_child[index]
+        if last == NO_NODE:
+            self.first_child[index] = child
+        else:
+            self.next_sibling[last] = child
+        self.last_child[index] = child
+        self.parent[child] = index
+        self.next_sibling[child] = NO_NODE
+        if self.visits[child] > 0:
+            self.refresh_best(index)
+
+    def remove_child(self, index, child):
+        previous = NO_NODE
+        current = self.first_child[index]
+        while current != NO_NODE and current != child:
+            previous = current
+            current = self.next_sibling[current]
+        if current == NO_NODE:
+            return
+        following = self.next_sibling[child]
+        if previous == NO_NODE:
+            self.first_child[index] = following
+        else:
+            self.next_sibling[previous] = following
+        if self.last_child[index] == child:
+            self.last_child[index] = previous
+        self.next_sibling[child] = NO_NODE
+        self.parent[child] = NO_NODE
+        self.refresh_best(index)
+
+    def copy_subtree(self, index):
+        # Duplicate a node and its descendants inside the pool
+        new_index = self.new_node()
+        for name in NodePool.DATA_COLUMNS:
+            column = getattr(self, name)
+            column[new_index] = column[index]
+        for child in self.children(index):
+            self.add_child(new_index, self.copy_subtree(child))
+        return new_index
+
+    def node_visits(self, index):
+        return self.visits[index] * self.scale
+
+    def ghost_sum(self, index):
+        if self.ghost_epoch[index] != self.epoch:
+            return 0.
+        return self.ghost[index]
+
+    def touch(self, index):
+        # Bring a node's ghost statistics up to the current epoch before modifying them
+        if self.ghost_epoch[index] != self.epoch:
+            self.ghost[index] = 0.
+            self.best_ghost[index] = 0.
+            self.ghost_epoch[index] = self.epoch
+
+    def apply_discount(self, discount):
+        """
+        Discounts the visits and rewards of every node and clears the ghost rewards.
+        Costs O(1) unless the scale gets small enough to need renormalizing.
+        """
+        self.scale *= discount
+        self.unit = 1. / self.scale
+        self.epoch += 1
+        if self.scale < MIN_SCALE:
+            self.renormalize()
+
+    def renormalize(self):
+        # Fold the scale back into the stored statistics
+        scale = self.scale
+        for name in ('visits', 'survival', 'pill', 'ghost'):
+            setattr(self, name, array('d', [value * scale for value in getattr(self, name)]))
+        self.scale = 1.
+        self.unit = 1.
+        # Rounding can move the means slightly, recompute the cached ones to match
+        for index in range(len(self)):
+            if self.visited[index]:
+                self.refresh_best(index)
+
+    def statistics(self, index):
+        # Return the (visits, survival, pill, ghost) totals of a node, undoing the scale
+        scale = self.scale
+        return (self.visits[index] * scale, self.survival[index] * scale, self.pill[index] * scale, self.ghost_sum(index) * scale)
+
+    def add_statistics(self, index, visits, survival, pill, ghost):
+        """
+        Adds totals gathered elsewhere (e.g. by another search) to a node. The
+        caller is responsible for refreshing the cached best means of its parent.
+        """
+        self.touch(index)
+        unit = self.unit
+        self.visits[index] += visits * unit
+        self.survival[index] += survival * unit
+        self.pill[index] += pill * unit
+        self.ghost[index] += ghost * unit
+
+    def add_virtual_loss(self, index, root, visits):
+        """
+        Adds visits without any reward to every node from index up to root, which
+        lowers their mean rewards. Passing a negative number of visits removes it.
+        """
+        unit = self.unit
+        while True:
+            self.visits[index] += visits * unit
+            if index == root:
+                return
+            index = self.parent[index]
+            self.refresh_best(index)
+
+    def mean_rewards(self, index):
+        visits = self.visits[index]
+        if visits > 0:
+            return {Tactic.SURVIVAL: self.survival[index]/visits, Tactic.PILL: self.pill[index]/visits, Tactic.GHOST: self.ghost_sum(index)/visits}
+        return {Tactic.SURVIVAL: 0, Tactic.PILL: 0, Tactic.GHOST: 0}
+
+    def best_means(self, index):
+        """
+        Returns the (survival, pill, ghost) maximum mean rewards over the children
+        of a node, or the node's own mean rewards if no child has been visited.
+        """
+        current = self.ghost_epoch[index] == self.epoch
+        if self.visited[index]:
+            return (self.best_survival[index], self.best_pill[index], self.best_ghost[index] if current else 0.)
+        visits = self.visits[index]
+        if visits > 0:
+            return (self.survival[index]/visits, self.pill[index]/visits, self.ghost[index]/visits if current else 0.)
+        return (0, 0, 0)
+
+    def refresh_best(self, index):
+        # Recompute the cached best mean rewards of a node from its children
+        self.touch(index)
+        survival_sums = self.survival
+        pill_sums = self.pill
+        ghost_sums = self.ghost
+        ghost_epoch = self.ghost_epoch
+        epoch = self.epoch
+        visits = self.visits
+        next_sibling = self.next_sibling
+        survival = pill = ghost = 0
+        visited = 0
+        child = self.first_child[index]
+        while child != NO_NODE:
+            child_visits = visits[child]
+            if child_visits > 0:
+                visited = 1
+                survival = max(survival, survival_sums[child]/child_visits)
+                pill = max(pill, pill_sums[child]/child_visits)
+                if ghost_epoch[child] == epoch:
+                    ghost = max(ghost, ghost_sums[child]/child_visits)
+            child = next_sibling[child]
+        self.best_survival[index] = survival
+        self.best_pill[index] = pill
+        self.best_ghost[index] = ghost
+        self.visited[index] = visited
+
+    def update(self, index, survival, pill, ghost, visits=1):
+        """
+        Adds playout results to a node and updates the cached best mean rewards
+        of its parent. Only the parent can be affected, and it only needs a
+        rescan when this node held its maximum and its mean went down. With
+        several visits, the rewards are the totals over those playouts.
+        """
+        self.touch(index)
+        unit = self.unit
+        added = visits * unit
+        visits = self.visits[index]
+        parent = self.parent[index]
+        if parent != NO_NODE and visits > 0:
+            old_survival = self.survival[index]/visits
+            old_pill = self.pill[index]/visits
+            old_ghost = self.ghost[index]/visits
+        else:
+            old_survival = old_pill = old_ghost = 0
+        visits += added
+        self.visits[index] = visits
+        self.survival[index] += survival * unit
+        self.pill[index] += pill * unit
+        self.ghost[index] += ghost * unit
+        if parent == NO_NODE:
+            return
+
+        self.touch(parent)
+        new_survival = self.survival[index]/visits
+        new_pill = self.pill[index]/visits
+        new_ghost = self.ghost[index]/visits
+        best_survival = self.best_survival
+        best_pill = self.best_pill
+        best_ghost = self.best_ghost
+        if ((new_survival < old_survival and old_survival == best_survival[parent]) or
+                (new_pill < old_pill and old_pill == best_pill[parent]) or
+                (new_ghost < old_ghost and old_ghost == best_ghost[parent])):
+            self.refresh_best(parent)
+            return
+        if new_survival > best_survival[parent]:
+            best_survival[parent] = new_survival
+        if new_pill > best_pill[parent]:
+            best_pill[parent] = new_pill
+        if new_ghost > best_ghost[parent]:
+            best_ghost[parent] = new_ghost
+        self.visited[parent] = 1
+
+    def maximum_mean_reward(self, index):
+        survival, pill, ghost = self.best_means(index)
+        return {Tactic.SURVIVAL: survival, Tactic.PILL: pill, Tactic.GHOST: ghost}
+
+    def value(self, index, tactic):
+        return tactic_value(self.best_means(index), tactic)
+
+    def child_means(self, index):
+        # Return the child indices of a node and the best means of each child
+        children = []
+        means = []
+        best_means = self.best_means
+        next_sibling = self.next_sibling
+        child = self.first_child[index]
+        while child != NO_NODE:
+            children.append(child)
+            means.append(best_means(child))
+            child = next_sibling[child]
+        return children, means
+
+    def child_values(self, index, tactic):
+        """
+        Scores every child of a node for the given tactic in a single pass over
+        the columns. Returns the list of child indices and the matching values.
+        """
+        children, means = self.child_means(index)
+        return children, [tactic_value(child_means, tactic) for child_means in means]
+
+    def should_compact(self):
+        return len(self) > max(1024, 2 * self.compacted_size)
+
+    def compact(self, root):
+        """
+        Copies the tree below root into fresh columns, dropping every node that
+        is no longer reachable. Returns the new index of root.
+        """
+        order = [root]
+        for index in order:
+            order.extend(self.children(index))
+        new_index = {old: new for new, old in enumerate(order)}
+
+        old = {name: getattr(self, name) for name in NodePool.LINK_COLUMNS + NodePool.DATA_COLUMNS}
+        scale, unit, epoch = self.scale, self.unit, self.epoch
+        self.clear()
+        self.scale, self.unit, self.epoch = scale, unit, epoch
+        for name in NodePool.LINK_COLUMNS:
+            column = getattr(self, name)
+            old_column = old[name]
+            column.extend(new_index.get(old_column[index], NO_NODE) for index in order)
+        for name in NodePool.DATA_COLUMNS:
+            column = getattr(self, name)
+            old_column = old[name]
+            column.extend(old_column[index] for index in order)
+        self.compacted_size = len(order)
+        return 0
+
 class MCTNode():
-    
-    # provides an ID per node
-    id = itertools.count()
-    
-    def __init__(self, position=None, actions=None):
-        self.children = []
-        self.parent = None
-
-        self.position = position
-        
-        self.visits = 0
-        self.rewards = {Tactic.SURVIVAL: 0., Tactic.PILL: 0., Tactic.GHOST: 0.}  # Tactics based scores
-        
-        self.actions = actions # list of actions taken to get to this node from the last node
-        self.id = next(MCTNode.id)
-    
+    """
+    A lightweight view of one node of a NodePool. Views are cheap to create and
+    compare equal when they refer to the same node, so they can be thrown away
+    and recreated freely.
+    """
+
+    __slots__ = ('pool', 'index')
+
+    def __init__(self, position=None, actions=None, pool=None, index=None):
+        if pool is None:
+            pool = NodePool()
+        if index is None:
+            index = pool.new_node(position, actions)
+        self.pool = pool
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, MCTNode) and self.index == other.index and self.pool is other.pool
+
+    def __hash__(self):
+        return hash((id(self.pool), self.index))
+
+    @property
+    def id(self):
+        return self.index
+
+    @property
+    def parent(self):
+        parent = self.pool.parent[self.index]
+        if parent == NO_NODE:
+            return None
+        return MCTNode(pool=self.pool, index=parent)
+
+    @parent.setter
+    def parent(self, parent):
+        # Only detaching is supported, use addChild to attach a node
+        if parent is not None:
+            raise ValueError('Use addChild to attach a node to a parent')
+        self.pool.parent[self.index] = NO_NODE
+
+    @property
+    def children(self):
+        pool = self.pool
+        return [MCTNode(pool=pool, index=child) for child in pool.children(self.index)]
+
+    @property
+    def position(self):
+        return self.pool.position(self.index)
+
+    @position.setter
+    def position(self, position):
+        self.pool.x[self.index] = position[0]
+        self.pool.y[self.index] = position[1]
+
+    @property
+    def actions(self):
+        return self.pool.action_seqs[self.pool.actions[self.index]]
+
+    @actions.setter
+    def actions(self, actions):
+        self.pool.actions[self.index] = self.pool.action_id(actions)
+
+    @property
+    def visits(self):
+        return self.pool.node_visits(self.index)
+
+    @visits.setter
+    def visits(self, visits):
+        self.pool.visits[self.index] = visits * self.pool.unit
+
+    @property
+    def rewards(self):
+        # Tactics based scores
+        pool = self.pool
+        index = self.index
+        scale = pool.scale
+        return {Tactic.SURVIVAL: pool.survival[index] * scale, Tactic.PILL: pool.pill[index] * scale, Tactic.GHOST: pool.ghost_sum(index) * scale}
+
+    @rewards.setter
+    def rewards(self, rewards):
+        pool = self.pool
+        index = self.index
+        pool.touch(index)
+        pool.survival[index] = rewards[Tactic.SURVIVAL] * pool.unit
+        pool.pill[index] = rewards[Tactic.PILL] * pool.unit
+        pool.ghost[index] = rewards[Tactic.GHOST] * pool.unit
+
     def addChild(self, child):
-        self.children.append(child)
-        child.parent = self
+        self.pool.add_child(self.index, child.index)
+
+    def removeChild(self, child):
+        self.pool.remove_child(self.index, child.index)
     
     # print out node's relations
     def print_relations(self, depth=0):
@@ -51,52 +513,32 @@ class MCTNode():
 
     def apply_discount(self, discount):
         # Apply discount to the pill and survival score, and set ghost score to 0
-        self.rewards[Tactic.PILL] *= discount
-        self.rewards[Tactic.SURVIVAL] *= discount
-        self.rewards[Tactic.GHOST] = 0
-        # Apply discount to the visits
-        self.visits *= discount
-        for child in self.children:
-            child.apply_discount(discount)
+        # The discount is applied lazily to every node in the pool, which is the whole tree
+        self.pool.apply_discount(discount)
 
     def mean_rewards(self):
         # Return the mean rewards for each tactic
-        return {tactic: reward/self.visits if self.visits > 0 else 0 for tactic, reward in self.rewards.items()}
+        return self.pool.mean_rewards(self.index)
 
     def maximum_mean_reward(self):
         # Return the maximum mean for each reward type from the children
         # If there are no children, or all children have 0 visits, return the current node's rewards
-        if sum([child.visits for child in self.children]) == 0:
-            return self.mean_rewards()
-        # Get the maximum mean reward for each tactic from the children
-        # Each tactic has its own maximum mean reward
-        return {tactic: max([child.mean_rewards()[tactic] for child in self.children]) for tactic in self.rewards.keys()}
+        return self.pool.maximum_mean_reward(self.index)
 
     def get_value(self, tactic):
         # Return the value of the node for the given tactic
-        best_rewards = self.maximum_mean_reward()
-        if tactic == Tactic.GHOST:
-            return best_rewards[Tactic.GHOST] * best_rewards[Tactic.SURVIVAL]
-        elif tactic == Tactic.PILL:
-            return best_rewards[Tactic.PILL] * best_rewards[Tactic.SURVIVAL]
-        elif tactic == Tactic.SURVIVAL:
-            return best_rewards[Tactic.SURVIVAL]
+        return self.pool.value(self.index, tactic)
 
     def copy(self):
-        # Return a copy of the node
-        new_node = MCTNode(self.position, self.actions)
-        new_node.visits = self.visits
-        new_node.rewards = self.rewards
-        for child in self.children:
-            new_node.addChild(child.copy())
-        return new_node
+        # Return a copy of the node and its descendants, stored in the same pool
+        return MCTNode(pool=self.pool, index=self.pool.copy_subtree(self.index))
 
 if __name__ == '__main__':
     root = MCTNode()
-    one = MCTNode()
-    two = MCTNode()
-    three = MCTNode()
-    four = MCTNode()
+    one = MCTNode(pool=root.pool)
+    two = MCTNode(pool=root.pool)
+    three = MCTNode(pool=root.pool)
+    four = MCTNode(pool=root.pool)
     
     root.addChild(one)
     root.addChild(two)
@@ -105,7 +547,8 @@ if __name__ == '__main__':
     
     root.print_relations()
     
-    root.removeDescendants()
+    root.removeChild(one)
+    root.removeChild(two)
     one = None
     two = None
     three = None
@@ -118,4 +561,4 @@ if __name__ == '__main__':
         print('Cannot print relations. Node does not exist.')
     
     
-    
\ No newline at end of file
+    
@@ -2,56 +2,40 @@
 Creates a tree of pacman junctions
 """
 
-import queue
-from MCTNode import MCTNode, Tactic
+from MCTNode import NodePool, Tactic
+from mazeDistances import MazeDistances
+from junctionGraph import JunctionGraph
 from game import Directions
 import time
-import util
 
 class PacmanTree():
 	def __init__(self, game_state):
 		self.walls = game_state.getWalls()
 		self.position = game_state.getPacmanPosition()
-		self.root = MCTNode(position=self.position)
+		self.pool = NodePool()
+		self.root = self.new_node(position=self.position)
 		self.tactic = Tactic.SURVIVAL
-		self.successors_lookup = {}
-		self.legal_lookup = {}
-		self.maze_distance_lookup = {}
+		layout = game_state.data.layout
+		self.graph = layout.getAnalysis(JunctionGraph)
+		self.distances = layout.getAnalysis(MazeDistances)
 
 	def is_junction(self, pos):
-		# Check if the position is a junction
 		# A junction is a position with more than 2 non-wall neighbours
 		# A junction is not a wall
-		if self.walls[pos[0]][pos[1]]:
-			return False
-		else:
-			# Adjacent positions
-			adjacent = [(pos[0]+1, pos[1]), (pos[0]-1, pos[1]), (pos[0], pos[1]+1), (pos[0], pos[1]-1)]
-
-			non_walls = [pos for pos in adjacent if not self.walls[pos[0]][pos[1]]]
-
-			return len(non_walls) > 2
+		return self.graph.is_junction(pos)
 
 	def get_legal_actions(self, pos):
 		# Legal actions do not move into a wall
 		# Does not use any game state information, only depends on the position and the walls
+		return self.graph.legal_actions(pos)
 
-		if pos in self.legal_lookup:
-			return self.legal_lookup[pos]
-
-		if self.walls[pos[0]][pos[1]]:
-			self.legal_lookup[pos] = []
-			return []
-
-		# Adjacent positions
-		adjacent = {(pos[0]+1, pos[1]): Directions.EAST, (pos[0]-1, pos[1]): Directions.WEST, (pos[0], pos[1]+1): Directions.NORTH, (pos[0], pos[1]-1): Directions.SOUTH}
-		# Legal actions are the adjacent positions that are not walls
-		legal_actions = [action for (adj_pos, action) in adjacent.items() if not self.walls[adj_pos[0]][adj_pos[1]]]
-		self.legal_lookup[pos] = legal_actions
-		return legal_actions
+	def new_node(self, position=None, actions=None):
+		# Allocate a node in the tree's node pool
+		return self.pool.node(self.pool.new_node(position, actions))
 
 	def reset(self, state):
-		self.root = MCTNode(state.getPacmanPosition())
+		self.pool.clear()
+		self.root = self.new_node(state.getPacmanPosition())
 
 	def update(self, new_state, timestep_discount):
 		new_pos = new_state.getPacmanPosition()
@@ -74,7 +58,7 @@ class PacmanTree():
 			# Check if the previous state was a junction
 			if self.is_junction(self.root.position):
 				# Find the child that is the new state based on the action taken
-				action = new_state.getPacmanState().getDirection()
+				action = new_state.getPacmanState(copy=False).getDirection()
 				new_root = None
 				for child in self.root.children:
 					if child.actions[0] == action:
@@ -88,22 +72,23 @@ class PacmanTree():
 					self.reset(new_state)
 					return
 				
-				old_root = self.root.copy()
+				# Re-root in place: the old root becomes a child of the new root, and
+				# only the edge actions change, no subtree is copied
+				old_root = self.root
+				old_children = old_root.children
 				self.root = new_root
-				self.root.parent = None
-				
-				# Remove new root from old root's children
-				if new_root in old_root.children:
-					old_root.children.remove(new_root)
-				
+				old_root.removeChild(new_root)
+
 				for (pos, actions) in self.successors(new_root.position):
 					if pos == old_root.position:
 						old_root.actions = actions
 						new_root.addChild(old_root)
-					if pos in child_positions:
-						new_child = old_root.children[child_positions.index(pos)].copy()
-						new_child.actions = actions
-						new_root.addChild(new_child)
+					elif pos in child_positions:
+						sibling = old_children[child_positions.index(pos)]
+						if sibling != new_root:
+							old_root.removeChild(sibling)
+							sibling.actions = actions
+							new_root.addChild(sibling)
 
 			# If the previous state was a tunnel, we should be on the same tunnel
 			else:
@@ -120,36 +105,53 @@ class PacmanTree():
 					self.reset(new_state)
 					return
 				
-		self.root.apply_discount(timestep_discount)
-
+		self.pool.apply_discount(timestep_discount)
+
+		# Drop the nodes that were cut off from the tree once they pile up
+		if self.pool.should_compact():
+			self.root = self.pool.node(self.pool.compact(self.root.index))
+
+
+	def root_statistics(self, depth=2):
+		# Returns the statistics of the top levels of the tree as the root's
+		# (visits, survival, pill, ghost) and nested lists of
+		# (position, actions, (visits, survival, pill, ghost), children)
+		def collect(index, depth):
+			pool = self.pool
+			return [(pool.position(child), pool.action_seqs[pool.actions[child]], pool.statistics(child),
+					 collect(child, depth - 1) if depth > 1 else [])
+					for child in pool.children(index)]
+		return (self.pool.statistics(self.root.index), collect(self.root.index, depth))
+
+	def merge_statistics(self, statistics):
+		# Adds statistics from root_statistics of another tree with the same root
+		# Nodes are matched by position and first action, missing ones are created
+		# The root gets the totals too, so that its visits stay those of all of
+		# its children when the tree is searched again on the next move
+		def merge(index, statistics):
+			pool = self.pool
+			children = {(pool.position(child), pool.action_seqs[pool.actions[child]][0]): child for child in pool.children(index)}
+			for (position, actions, totals, grandchildren) in statistics:
+				child = children.get((position, actions[0]))
+				if child is None:
+					child = pool.new_node(position, actions)
+					pool.add_child(index, child)
+				merge(child, grandchildren)
+				pool.add_statistics(child, *totals)
+			pool.refresh_best(index)
+		(root_totals, children) = statistics
+		merge(self.root.index, children)
+		self.pool.add_statistics(self.root.index, *root_totals)
 
 	def successors(self, position):
 		# Returns a list of (position, actions) tuples
 		# positions are the next junctions after taking the action from the position
 		# actions is the sequence of actions to get to junction from the position
+		return self.graph.successors_of(position)
 
-		# Check if the node's position is in the lookup
-		if position in self.successors_lookup:
-			return self.successors_lookup[position]
-
-		successors = []
-
-		# Get the legal actions from the node's position
-		legal_actions = self.get_legal_actions(position)
-
-		# Get the next junctions after taking the legal actions
-		for action in legal_actions:
-			next_pos = self.next_position(position, action)
-			actions = [action]
-			while not self.is_junction(next_pos) and len(self.get_legal_actions(next_pos)) > 1:
-				# Find the legal actions at this position (should be 2), and choose the one that is not the reverse of the last action
-				actions.append([action for action in self.get_legal_actions(next_pos) if action != Directions.REVERSE[actions[-1]]][0])
-				next_pos = self.next_position(next_pos, actions[-1])
-			successors.append((next_pos, actions))
-
-		self.successors_lookup[position] = successors
-
-		return successors
+	def successor_cells(self, position):
+		# Returns the positions visited on the way to each successor, in the same order
+		return self.graph.successor_cells_of(position)
 
 	def next_position(self, pos, action):
 		action_offsets = {Directions.NORTH: (0, 1), Directions.SOUTH: (0, -1), Directions.EAST: (1, 0), Directions.WEST: (-1, 0)}
@@ -163,87 +165,16 @@ class PacmanTree():
 
 	def maze_distance(self, start, end):
 		# Returns the distance between two positions along the maze, along with the actions to get there
-		# Uses an A* search where the heuristic is the manhattan distance
 		# Returns inf if the end position is not reachable from the start position
-
-		# Check if the start and end positions are the same
 		if start == end:
 			return 0, []
+		distance = self.distances.distance(start, end)
+		if distance == float('inf'):
+			return distance, []
+		return distance, self.distances.path(start, end)
 
-		# Check if the start and end positions are in the lookup
-		if (start, end) in self.maze_distance_lookup:
-			return self.maze_distance_lookup[(start, end)]
-
-		# A* search
-
-		# Initialize the frontier with the start position
-		frontier = queue.PriorityQueue()
-		frontier.put((0, start))
-
-		# Initialize the explored set
-		explored = set()
-
-		# Initialize the actions dictionary
-		actions = {}
-
-		# Initialize the cost dictionary
-		costs = {}
-
-		# Initialize the cost of the start position to be 0
-		costs[start] = 0
-
-		# Initialize the actions of the start position to be empty
-		actions[start] = []
-
-		result = None
-
-		# While the frontier is not empty
-		while not frontier.empty():
-			# Get the next position from the frontier
-			current_cost, current_pos = frontier.get()
-
-			# Check if the current position is the end position
-			if current_pos == end:
-				# Return the cost and actions to get to the end position
-				result = (current_cost, actions[current_pos])
-				break
-
-			# Add the current position to the explored set
-			explored.add(current_pos)
-
-			# Get the next reachable positions from the current position
-			for next_action in self.get_legal_actions(current_pos):
-				next_pos = self.next_position(current_pos, next_action)
-
-				# Check if the next position is in the explored set
-				if next_pos in explored:
-					continue
-
-				# Get the cost of the next position
-				next_cost = current_cost + 1
-
-				# Check if the next position is in the frontier
-				if next_pos not in costs or next_cost < costs[next_pos]:
-					# Update the cost of the next position
-					costs[next_pos] = next_cost
-
-					# Update the actions of the next position
-					actions[next_pos] = actions[current_pos] + [next_action]
-
-					# Add the next position to the frontier
-					frontier.put((next_cost + util.manhattanDistance(next_pos, end), next_pos))
-
-		# Check if the result is None
-		if result is None:
-			# Return inf
-			result = (float('inf'), [])
-		
-		# Add the result to the lookup
-		self.maze_distance_lookup[(start, end)] = result
-
-		reversed_actions = [Directions.REVERSE[action] for action in reversed(result[1])]
-
-		self.maze_distance_lookup[(end, start)] = (result[0], reversed_actions)
-
-		return result
-
+	def distance(self, start, end):
+		# Same as maze_distance, without building the actions
+		if start == end:
+			return 0
+		return self.distances.distance(start, end)
@@ -25,6 +25,7 @@ import time
 import os
 import traceback
 import sys
+import random
 
 #######################
 # Parts worth reading #
@@ -79,11 +80,44 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are immutable and interned: there is one object per
+    position and direction, shared by every state, so moving an agent
+    allocates nothing once its configuration has been seen.
     """
 
-    def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+    __slots__ = ('pos', 'direction')
+
+    # Every configuration created so far, by direction and coordinate types and
+    # then by position. The types keep (1, 2) and (1.0, 2.0) apart, since grids
+    # can only be indexed with integers.
+    interned = {}
+
+    def __new__(cls, pos, direction):
+        key = (direction, type(pos[0]), type(pos[1]))
+        configs = Configuration.interned.get(key)
+        if configs is None:
+            configs = Configuration.interned[key] = {}
+        config = configs.get(pos)
+        if config is None:
+            config = object.__new__(cls)
+            object.__setattr__(config, 'pos', pos)
+            object.__setattr__(config, 'direction', direction)
+            configs[pos] = config
+        return config
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Configurations are immutable, can't set " + name)
+
+    def __reduce__(self):
+        # Unpickle to the interned configuration of the receiving process
+        return (Configuration, (self.pos, self.direction))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def getPosition(self):
         return (self.pos)
@@ -129,6 +163,8 @@ class AgentState:
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
 
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
+
     def __init__(self, startConfiguration, isPacman):
         self.start = startConfiguration
         self.configuration = startConfiguration
@@ -153,7 +189,10 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy(self):
-        state = AgentState(self.start, self.isPacman)
+        # Configurations are immutable, so the copy shares them
+        state = AgentState.__new__(AgentState)
+        state.start = self.start
+        state.isPacman = self.isPacman
         state.configuration = self.configuration
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
@@ -293,6 +332,139 @@ class Grid:
         return bools
 
 
+class BitGrid:
+    """
+    A 2-dimensional grid of booleans stored as the bits of a single int, with
+    cell (x,y) at bit x * height + y. Since ints are immutable, copies share
+    the bits and cost O(1), and the number of True cells is kept up to date.
+
+    grid[x][y] reads and writes cells as on a Grid, through a column proxy;
+    test, set and clear skip the proxy.
+    """
+
+    def __init__(self, width, height, initialValue=False):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self.numSet = width * height
+        else:
+            self.bits = 0
+            self.numSet = 0
+
+    @staticmethod
+    def fromGrid(grid):
+        bitGrid = BitGrid(grid.width, grid.height)
+        for x, y in grid.asList():
+            bitGrid.set(x, y)
+        return bitGrid
+
+    def test(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y):
+        bit = 1 << (x * self.height + y)
+        if not self.bits & bit:
+            self.bits |= bit
+            self.numSet += 1
+
+    def clear(self, x, y):
+        bit = 1 << (x * self.height + y)
+        if self.bits & bit:
+            self.bits ^= bit
+            self.numSet -= 1
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if not 0 <= x < self.width:
+            raise IndexError('grid column out of range')
+        return BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y, value in enumerate(column):
+            self[x][y] = value
+
+    def __str__(self):
+        out = [[str(self.test(x, y))[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if not isinstance(other, BitGrid):
+            return self.asList() == other.asList() and (self.width, self.height) == (other.width, other.height)
+        return self.bits == other.bits and (self.width, self.height) == (other.width, other.height)
+
+    def __hash__(self):
+        # Same value as Grid.__hash__ for the same cells
+        return hash(self.bits)
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        g.numSet = self.numSet
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        if item:
+            return self.numSet
+        return self.width * self.height - self.numSet
+
+    def asList(self, key=True):
+        bits = self.bits if key else self.bits ^ ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append((index // self.height, index % self.height))
+            bits ^= low
+        return list
+
+
+class BitGridColumn:
+    """
+    Column x of a BitGrid, so that grid[x][y] works as on a Grid.
+    """
+
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if not 0 <= y < height:
+            raise IndexError('grid row out of range')
+        return (self.grid.bits >> (self.x * height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError('grid row out of range')
+        if value:
+            self.grid.set(self.x, y)
+        else:
+            self.grid.clear(self.x, y)
+
+    def __len__(self):
+        return self.grid.height
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
@@ -393,6 +565,107 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+class MoveTables:
+    """
+    The legal moves from every open cell of a layout, computed once from the
+    walls. Cells are numbered x * height + y. Pacman's moves are listed per
+    cell and the ghosts' per cell and heading, since ghosts can neither stop
+    nor turn around. The moves are tuples in the order of getPossibleActions
+    and are shared, so callers that change them must copy them first. Every
+    Layout builds its own, as layout.moveTables.
+    """
+
+    def __init__(self, walls):
+        self.height = walls.height
+        self.pacmanActions = {}
+        self.ghostActions = {}
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if walls[x][y]:
+                    continue
+                cell = x * walls.height + y
+                possible = tuple(dir for dir, (dx, dy) in Actions._directionsAsList if not walls[x + dx][y + dy])
+                self.pacmanActions[cell] = possible
+                moves = [dir for dir in possible if dir != Directions.STOP]
+                for heading in Actions._directions:
+                    reverse = Actions.reverseDirection(heading)
+                    if reverse in moves and len(moves) > 1:
+                        self.ghostActions[(cell, heading)] = tuple(dir for dir in moves if dir != reverse)
+                    else:
+                        self.ghostActions[(cell, heading)] = tuple(moves)
+
+    def getPacmanActions(self, config):
+        """
+        The moves of Actions.getPossibleActions for the configuration.
+        """
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+        # In between grid points, all agents must continue straight
+        if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
+            return (config.direction,)
+        return self.pacmanActions[x_int * self.height + y_int]
+
+    def getGhostActions(self, config):
+        """
+        The moves of GhostRules.getLegalActions for the configuration.
+        """
+        x, y = config.pos
+        x_int, y_int = int(x + 0.5), int(y + 0.5)
+        # Scared ghosts move at half speed, so they can be in between grid points
+        if (abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE):
+            if config.direction == Directions.STOP:
+                return ()
+            return (config.direction,)
+        return self.ghostActions[(x_int * self.height + y_int, config.direction)]
+
+
+class Zobrist:
+    """
+    Random 63 bit keys for the parts of a game state, for Zobrist hashing. The
+    hash of a state is the xor of the keys of its food, capsules, agent
+    configurations and scared timers, so the rules keep it up to date by
+    xoring out the keys of what a move changes and xoring in the new ones.
+    Keys are derived from what they stand for, so every process agrees on
+    them, and positions are keyed as floats, so (1, 2) and (1.0, 2.0), which
+    are equal, get the same key.
+    """
+    keys = {}
+
+    # Keys of the configurations and scared timers of each agent, by the id of
+    # the (interned) configuration and by the timer
+    configurationKeys = []
+    timerKeys = []
+
+    def key(*parts):
+        if parts not in Zobrist.keys:
+            Zobrist.keys[parts] = random.Random(repr(parts)).getrandbits(63)
+        return Zobrist.keys[parts]
+    key = staticmethod(key)
+
+    def food(x, y):
+        return Zobrist.key('food', x, y)
+    food = staticmethod(food)
+
+    def capsule(pos):
+        return Zobrist.key('capsule', float(pos[0]), float(pos[1]))
+    capsule = staticmethod(capsule)
+
+    def agent(index, agentState):
+        configuration = agentState.configuration
+        try:
+            return Zobrist.configurationKeys[index][id(configuration)] ^ Zobrist.timerKeys[index][agentState.scaredTimer]
+        except (IndexError, KeyError):
+            while len(Zobrist.configurationKeys) <= index:
+                Zobrist.configurationKeys.append({})
+                Zobrist.timerKeys.append({})
+            x, y = configuration.pos
+            # Interned configurations live forever, so their ids are never reused
+            Zobrist.configurationKeys[index][id(configuration)] = Zobrist.key('agent', index, float(x), float(y), configuration.direction)
+            Zobrist.timerKeys[index][agentState.scaredTimer] = Zobrist.key('scared', index, agentState.scaredTimer)
+            return Zobrist.agent(index, agentState)
+    agent = staticmethod(agent)
+
+
 class GameStateData:
 
     def __init__(self, prevState=None):
@@ -400,12 +673,17 @@ class GameStateData:
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
+            # The food is shared until one of the two states eats some (see PacmanRules.consume)
+            self.food = prevState.food
+            self._foodOwned = False
+            prevState._foodOwned = False
             self.capsules = prevState.capsules[:]
             self.agentStates = self.copyAgentStates(prevState.agentStates)
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self.numFood = prevState.numFood
+            self._hash = prevState._hash
 
         self._foodEaten = None
         self._foodAdded = None
@@ -414,11 +692,43 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        self._undoLog = []
+
+    def pushUndo(self):
+        """
+        Saves everything a move can change on the undo log and returns the record.
+        Giving up ownership of the food makes the rules copy it before a change,
+        so keeping a reference is enough; the capsules and the eaten flags are
+        changed in place.
+        """
+        agents = [(agentState, agentState.configuration, agentState.scaredTimer) for agentState in self.agentStates]
+        record = (agents, self.food, self.numFood, self._hash, self.capsules[:], self._eaten[:], self.score, self.scoreChange,
+                  self._win, self._lose, self._foodEaten, self._foodAdded, self._capsuleEaten, self._agentMoved)
+        self._undoLog.append(record)
+        self._foodOwned = False
+        return record
+
+    def popUndo(self):
+        """
+        Restores the data saved by the last call to pushUndo and returns its record.
+        The restored food stays unowned, as successors made since the push may
+        share it.
+        """
+        record = self._undoLog.pop()
+        self._foodOwned = False
+        (agents, self.food, self.numFood, self._hash, self.capsules, self._eaten, self.score, self.scoreChange,
+         self._win, self._lose, self._foodEaten, self._foodAdded, self._capsuleEaten, self._agentMoved) = record
+        for agentState, configuration, scaredTimer in agents:
+            agentState.configuration = configuration
+            agentState.scaredTimer = scaredTimer
+        return record
 
     def deepCopy(self):
+        foodOwned = self._foodOwned
         state = GameStateData(self)
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state._foodOwned = True
+        self._foodOwned = foodOwned
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -450,15 +760,24 @@ class GameStateData:
 
     def __hash__(self):
         """
-        Allows states to be keys of dictionaries.
+        Allows states to be keys of dictionaries. The Zobrist hash is kept up
+        to date by the rules, so this is O(1). It leaves out the score, so
+        states that differ only in score share a hash.
+        """
+        return self._hash
+
+    def computeHash(self):
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113 * hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575)
+        Computes the Zobrist hash of the state from scratch.
+        """
+        h = 0
+        for x, y in self.food.asList():
+            h ^= Zobrist.food(x, y)
+        for capsule in self.capsules:
+            h ^= Zobrist.capsule(capsule)
+        for index, agentState in enumerate(self.agentStates):
+            h ^= Zobrist.agent(index, agentState)
+        return h
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
@@ -518,9 +837,11 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
+        self._foodOwned = True # whether no other state shares self.food
+        self.numFood = self.food.count() # kept up to date by the rules as food is eaten
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -536,6 +857,7 @@ class GameStateData:
             self.agentStates.append(AgentState(
                 Configuration(pos, Directions.STOP), isPacman))
         self._eaten = [False for a in self.agentStates]
+        self._hash = self.computeHash()
 
 
 try:
@@ -0,0 +1,121 @@
+"""
+The junction graph of a layout, compiled once from the walls.
+
+Junctions are open cells with more than two open neighbours. Along with the
+dead ends, they are joined by edges: the corridors between them, stored as
+their cells and the actions that walk them. Every corridor cell knows the edges
+running through it, so the next junctions from any open cell are known
+without walking the maze.
+"""
+
+from array import array
+from game import Directions
+from layout import OpenCells, NO_CELL
+
+# Moves in the order PacmanTree lists the legal actions
+MOVES = [(Directions.EAST, (1, 0)), (Directions.WEST, (-1, 0)), (Directions.NORTH, (0, 1)), (Directions.SOUTH, (0, -1))]
+
+
+class JunctionGraph():
+	"""
+	Junctions, edges and the successors of every open cell of a layout, kept
+	with the layout (layout.getAnalysis(JunctionGraph)). Cells are numbered in
+	the order of their positions, x first.
+	"""
+
+	def __init__(self, layout):
+		walls = layout.walls
+		self.width = walls.width
+		self.height = walls.height
+		self.offsets = dict(MOVES)
+
+		# Open cells, numbered as in the other analyses of the layout, and their legal actions
+		open_cells = layout.getAnalysis(OpenCells)
+		self.cell_ids = open_cells.ids
+		self.cells = open_cells.cells
+		self.legal = [[action for action, (dx, dy) in MOVES if not walls[x + dx][y + dy]] for (x, y) in self.cells]
+
+		# Junctions, numbered in cell order
+		self.junction_ids = array('i', [NO_CELL]) * len(self.cells)
+		self.junctions = []
+		for cell, actions in enumerate(self.legal):
+			if len(actions) > 2:
+				self.junction_ids[cell] = len(self.junctions)
+				self.junctions.append(cell)
+
+		# Edges start at every junction and dead end, one per legal action, and
+		# end at the first junction or dead end along the way. Corridor cells
+		# record the edges going through them, with their index along the edge.
+		self.edge_start = array('i')
+		self.edge_end = array('i')
+		self.edge_length = array('i')
+		self.edge_cells = []
+		self.edge_actions = []
+		self.out_edges = [[] for _ in self.cells]
+		self.corridor_edges = [[] for _ in self.cells]
+		for cell, actions in enumerate(self.legal):
+			if self.is_corridor_cell(cell):
+				continue
+			for action in actions:
+				edge = len(self.edge_cells)
+				path_actions = [action]
+				path_cells = [self.next_cell(cell, action)]
+				while self.is_corridor_cell(path_cells[-1]):
+					self.corridor_edges[path_cells[-1]].append((edge, len(path_cells) - 1))
+					reverse = Directions.REVERSE[path_actions[-1]]
+					path_actions.append([next_action for next_action in self.legal[path_cells[-1]] if next_action != reverse][0])
+					path_cells.append(self.next_cell(path_cells[-1], path_actions[-1]))
+				self.edge_start.append(cell)
+				self.edge_end.append(path_cells[-1])
+				self.edge_length.append(len(path_cells))
+				self.edge_cells.append(tuple(self.cells[path_cell] for path_cell in path_cells))
+				self.edge_actions.append(path_actions)
+				self.out_edges[cell].append(edge)
+
+		# Successors of every cell, as PacmanTree.successors returns them: the
+		# next junctions (or dead ends) with the actions to reach them, and the
+		# cells on the way
+		self.successors = []
+		self.successor_cells = []
+		for cell, actions in enumerate(self.legal):
+			if not self.is_corridor_cell(cell):
+				edges = [(edge, 0) for edge in self.out_edges[cell]]
+			else:
+				# Continue along the edges through the cell, in the order of the legal actions
+				edges = []
+				for action in actions:
+					for edge, index in self.corridor_edges[cell]:
+						if self.edge_actions[edge][index + 1] == action:
+							edges.append((edge, index + 1))
+							break
+			self.successors.append([(self.cells[self.edge_end[edge]], self.edge_actions[edge][index:]) for edge, index in edges])
+			self.successor_cells.append([self.edge_cells[edge][index:] for edge, index in edges])
+
+	def is_corridor_cell(self, cell):
+		return len(self.legal[cell]) == 2
+
+	def next_cell(self, cell, action):
+		x, y = self.cells[cell]
+		dx, dy = self.offsets[action]
+		return self.cell_ids[(x + dx) * self.height + y + dy]
+
+	def cell_id(self, pos):
+		return self.cell_ids[pos[0] * self.height + pos[1]]
+
+	# Lookups by position, for PacmanTree
+
+	def is_junction(self, pos):
+		cell = self.cell_id(pos)
+		return cell != NO_CELL and self.junction_ids[cell] != NO_CELL
+
+	def legal_actions(self, pos):
+		cell = self.cell_id(pos)
+		if cell == NO_CELL:
+			return []
+		return self.legal[cell]
+
+	def successors_of(self, pos):
+		return self.successors[self.cell_id(pos)]
+
+	def successor_cells_of(self, pos):
+		return self.successor_cells[self.cell_id(pos)]
@@ -13,17 +13,38 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, MoveTables
 import os
 import random
+from array import array
 from functools import reduce
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# Layouts by their text, so that every state of a game shares one Layout
+LAYOUT_CACHE = {}
+
+
+def internLayout(layoutText):
+    """
+    Returns the shared Layout for the given lines of text, parsing them only
+    the first time.
+    """
+    key = "\n".join(layoutText)
+    if key not in LAYOUT_CACHE:
+        LAYOUT_CACHE[key] = Layout(layoutText)
+    return LAYOUT_CACHE[key]
+
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are immutable once built: the capsules and agent positions are
+    tuples, attributes can't be reassigned, and the walls and food grids must
+    not be changed (game states copy the food before eating it). Copying a
+    layout returns the layout itself. Tables computed from the walls are kept
+    with the layout (see getAnalysis), so every state on it shares them.
     """
 
     def __init__(self, layoutText):
@@ -35,13 +56,38 @@ class Layout:
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
-        self.layoutText = layoutText
+        self.layoutText = tuple(layoutText)
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
         self.totalFood = len(self.food.asList())
+        self.moveTables = MoveTables(self.walls)
+        self.analyses = {}
+        self._frozen = True
         # self.initializeVisibilityMatrix()
 
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("Layouts are immutable, can't set " + name)
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        # Unpickle to the shared layout of the receiving process
+        return (internLayout, (self.layoutText,))
+
     def getNumGhosts(self):
         return self.numGhosts
 
+    def getAnalysis(self, kind):
+        """
+        Returns kind(self), an analysis of the layout such as its JunctionGraph,
+        built the first time it is asked for and kept with the layout.
+        """
+        analysis = self.analyses.get(kind)
+        if analysis is None:
+            analysis = kind(self)
+            self.analyses[kind] = analysis
+        return analysis
+
     def initializeVisibilityMatrix(self):
         global VISIBILITY_MATRIX_CACHE
         if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
@@ -60,11 +106,11 @@ class Layout:
                             while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)]:
                                 vis[x][y][direction].add((nextx, nexty))
                                 nextx, nexty = x + dx, y + dy
-            self.visibility = vis
+            object.__setattr__(self, 'visibility', vis)
             VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
         else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
-                str.__add__, self.layoutText)]
+            object.__setattr__(self, 'visibility', VISIBILITY_MATRIX_CACHE[reduce(
+                str.__add__, self.layoutText)])
 
     def isWall(self, pos):
         x, col = pos
@@ -97,7 +143,7 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -137,6 +183,30 @@ class Layout:
             self.numGhosts += 1
 
 
+# Cell id of the walls in OpenCells.ids
+NO_CELL = -1
+
+
+class OpenCells:
+    """
+    The open cells of a layout, numbered in the order of their positions, x
+    first. ids maps the cell x * height + y of the grid to the number of the
+    open cell there, or NO_CELL. Shared by the analyses that number cells
+    (layout.getAnalysis(OpenCells)).
+    """
+
+    def __init__(self, layout):
+        walls = layout.walls
+        self.height = walls.height
+        self.cells = []
+        self.ids = array('i', [NO_CELL]) * (walls.width * walls.height)
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if not walls[x][y]:
+                    self.ids[x * walls.height + y] = len(self.cells)
+                    self.cells.append((x, y))
+
+
 def getLayout(name, back=2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -159,6 +229,6 @@ def tryToLoad(fullname):
         return None
     f = open(fullname)
     try:
-        return Layout([line.strip() for line in f])
+        return internLayout([line.strip() for line in f])
     finally:
         f.close()
@@ -0,0 +1,102 @@
+"""
+An on-disk cache for the analysis of layouts, shared by every process.
+
+Tables computed from a layout are stored as flat arrays in a binary file named
+after a hash of the walls they were computed from, in the directory given by
+the PACMAN_LAYOUT_CACHE environment variable (layout_cache next to this file
+by default). Files are memory mapped when loaded, so processes analysing the
+same layout, such as the pool workers of run_parallel_tests.py, share one copy
+through the page cache instead of each building their own.
+
+File format: the magic bytes, a format version and the number of arrays, then
+for each array its typecode and length, followed by the array data, each array
+starting on a multiple of 8 bytes.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b'PLAC'
+# Bumped whenever the file format or the arrays stored for an analysis change,
+# so that files written by older code are rebuilt rather than misread
+VERSION = 2
+HEADER = struct.Struct('<4sII')
+ARRAY_HEADER = struct.Struct('<cxxxxxxxQ')
+
+
+def cache_directory():
+    return os.environ.get('PACMAN_LAYOUT_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layout_cache'))
+
+
+def cache_path(name, walls):
+    # Files are addressed by the content of the walls and the name of the analysis
+    digest = hashlib.sha1(('%d %d\n%s' % (walls.width, walls.height, str(walls))).encode()).hexdigest()
+    return os.path.join(cache_directory(), '%s.%s.bin' % (digest, name))
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def load(name, walls):
+    """
+    Returns the arrays stored for the analysis of the walls as read-only
+    memoryviews into the mapped file, or None if they aren't cached.
+    """
+    try:
+        with open(cache_path(name, walls), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(data)
+    try:
+        magic, version, count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            return None
+        offset = HEADER.size
+        headers = []
+        for _ in range(count):
+            typecode, length = ARRAY_HEADER.unpack_from(view, offset)
+            headers.append((typecode.decode(), length))
+            offset += ARRAY_HEADER.size
+        arrays = []
+        for typecode, length in headers:
+            offset = align(offset)
+            size = length * array(typecode).itemsize
+            if offset + size > len(view):
+                return None
+            arrays.append(view[offset:offset + size].cast(typecode))
+            offset += size
+    except (struct.error, ValueError):
+        return None
+    return arrays
+
+
+def store(name, walls, arrays):
+    """
+    Writes the arrays computed for the walls to the cache. The file is written
+    under a temporary name and then renamed, so other processes never see a
+    partial file. Failing to write, e.g. to a read-only directory, is ignored.
+    """
+    path = cache_path(name, walls)
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(cache_directory(), exist_ok=True)
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(arrays)))
+            offset = HEADER.size
+            for values in arrays:
+                f.write(ARRAY_HEADER.pack(values.typecode.encode(), len(values)))
+                offset += ARRAY_HEADER.size
+            for values in arrays:
+                padding = align(offset) - offset
+                f.write(b'\0' * padding)
+                f.write(values.tobytes())
+                offset += padding + len(values) * values.itemsize
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
@@ -0,0 +1,117 @@
+"""
+Maze distances between every pair of open cells of a layout.
+
+The distances come from a breadth first search from every open cell and are
+stored in a flat array of shorts, along with the first move of a shortest path
+between every pair of cells. Paths are only built, from those moves, when they
+are asked for. The tables are kept in the layout cache (see layoutCache.py), so
+they are computed once per layout rather than once per process, and with the
+layout (layout.getAnalysis(MazeDistances)) once loaded.
+"""
+
+from array import array
+from game import Directions
+from layout import OpenCells
+import layoutCache
+
+# Moves in the order the searches try them
+MOVES = [(Directions.NORTH, (0, 1)), (Directions.SOUTH, (0, -1)), (Directions.EAST, (1, 0)), (Directions.WEST, (-1, 0))]
+
+UNREACHABLE = -1
+
+
+class MazeDistances():
+	"""
+	Distance and next move tables of a layout.
+	"""
+
+	def __init__(self, layout):
+		walls = layout.walls
+		self.width = walls.width
+		self.height = walls.height
+
+		# The open cells, numbered as in the other analyses of the layout
+		open_cells = layout.getAnalysis(OpenCells)
+		self.cells = open_cells.cells
+		self.cell_ids = open_cells.ids
+		num_cells = len(self.cells)
+		self.num_cells = num_cells
+
+		# The tables are loaded from the layout cache, or built and added to it
+		arrays = layoutCache.load('distances', walls)
+		if arrays is not None and len(arrays) == 2 and all(len(values) == num_cells * num_cells for values in arrays):
+			self.distances, self.first_moves = arrays
+			return
+
+		# Open neighbours of each cell as (move index, cell id)
+		neighbours = []
+		for (x, y) in self.cells:
+			neighbours.append([(move, self.cell_ids[(x + dx) * self.height + y + dy])
+							   for move, (direction, (dx, dy)) in enumerate(MOVES) if not walls[x + dx][y + dy]])
+
+		# Row s holds the distances from cell s and the first move towards every cell
+		self.distances = array('h', [UNREACHABLE]) * (num_cells * num_cells)
+		self.first_moves = array('b', [UNREACHABLE]) * (num_cells * num_cells)
+		distances = self.distances
+		first_moves = self.first_moves
+		for source in range(num_cells):
+			row = source * num_cells
+			distances[row + source] = 0
+			frontier = []
+			for move, cell in neighbours[source]:
+				distances[row + cell] = 1
+				first_moves[row + cell] = move
+				frontier.append(cell)
+			distance = 1
+			while frontier:
+				distance += 1
+				next_frontier = []
+				for cell in frontier:
+					move = first_moves[row + cell]
+					for _, next_cell in neighbours[cell]:
+						if distances[row + next_cell] == UNREACHABLE:
+							distances[row + next_cell] = distance
+							first_moves[row + next_cell] = move
+							next_frontier.append(next_cell)
+				frontier = next_frontier
+		layoutCache.store('distances', walls, [self.distances, self.first_moves])
+
+	def cell_id(self, pos):
+		# Id of the open cell at pos, or UNREACHABLE for walls, positions outside
+		# of the layout and positions in between cells
+		x, y = pos
+		if x != int(x) or y != int(y):
+			return UNREACHABLE
+		x, y = int(x), int(y)
+		if not (0 <= x < self.width and 0 <= y < self.height):
+			return UNREACHABLE
+		return self.cell_ids[x * self.height + y]
+
+	def distance(self, start, end):
+		# Returns the maze distance between two positions, inf if there is no path
+		source = self.cell_id(start)
+		target = self.cell_id(end)
+		if source == UNREACHABLE or target == UNREACHABLE:
+			return float('inf')
+		distance = self.distances[source * self.num_cells + target]
+		if distance == UNREACHABLE:
+			return float('inf')
+		return distance
+
+	def path(self, start, end):
+		# Returns the actions of a shortest path between two positions, [] if there is none
+		source = self.cell_id(start)
+		target = self.cell_id(end)
+		if source == UNREACHABLE or target == UNREACHABLE:
+			return []
+		actions = []
+		x, y = self.cells[source]
+		while source != target:
+			move = self.first_moves[source * self.num_cells + target]
+			if move == UNREACHABLE:
+				return []
+			direction, (dx, dy) = MOVES[move]
+			actions.append(direction)
+			x, y = x + dx, y + dy
+			source = self.cell_ids[x * self.height + y]
+		return actions
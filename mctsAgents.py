@@ -1,11 +1,17 @@
 import math
 import time
 import random
+import threading
+import copy
+import numpy as np
 from util import manhattanDistance, Counter
-from MCTNode import MCTNode, Tactic
+from MCTNode import Tactic, tactic_value
 from PacmanTree import PacmanTree
+from playoutState import PlayoutState
+from playoutBatch import PlayoutBatch
 from pacman import GhostRules, COLLISION_TOLERANCE, SCARED_TIME
 from ghostAgents import *
+from workerPools import get_worker_pool, usable_workers
 
 from game import Agent, Directions
 
@@ -17,6 +23,27 @@ def debug(*args):
 
 ghost_types = {'RandomGhost': RandomGhost, 'DirectionalGhost': DirectionalGhost}
 
+# Agents living in a worker process, one per set of agent arguments
+worker_agents = {}
+
+def search_worker(agent_args, gameState, num_pills, seed):
+    """
+    Runs an independent search from gameState inside a worker process and returns
+    the simulation counts along with the statistics of the top of its tree.
+    """
+    key = tuple(sorted(agent_args.items()))
+    if key not in worker_agents:
+        worker_agents[key] = MCTSAgent(**agent_args)
+    agent = worker_agents[key]
+    random.seed(seed)
+    if agent.tree == None or agent.tree.walls != gameState.getWalls():
+        agent.tree = PacmanTree(gameState)
+    else:
+        agent.tree.reset(gameState)
+    agent.num_pills = num_pills
+    num_simulations, num_survived = agent.runMCTS(gameState)
+    return num_simulations, num_survived, agent.tree.root_statistics()
+
 class MCTSAgent(Agent):
     """
     A MCTS agent's decision making is implemented with a decision tree, and it also involves some randomness. Every time an action is chosen, it simulates the rest of the game to help evaluate the actions chosen. It is expected for the agent to simulate the game numerous times in order to evaluate its decisions.
@@ -45,6 +72,10 @@ class MCTSAgent(Agent):
         self.use_long_term_goals = True # whether to use long term goals
         self.use_tactics = True # whether to use tactics like ghost hunting or pill hunting
         self.ghost_type = "RandomGhost"
+        self.workers = 1 # number of processes searching from the root in parallel, each with its own tree
+        self.threads = 1 # number of threads searching the same tree in parallel
+        self.virtual_loss = 1.0 # visits without reward added to a path while a thread simulates it
+        self.leaf_batch = 0 # number of playouts run together on NumPy arrays from each selected leaf, 0 to run them one by one
 
         for key in dir(self):
             val = getattr(self, key)
@@ -56,6 +87,10 @@ class MCTSAgent(Agent):
                 except:
                     print("Couldn't set value for key: " + key + " to value: " + args[key])
 
+        # Arguments for the agents of the worker processes, which search on their own
+        self.worker_args = {key: val for key, val in args.items() if key != 'workers'}
+        self.workers = usable_workers(self.workers)
+
         if self.ghost_type in ghost_types:
             self.simulated_ghost_agent = ghost_types[self.ghost_type](index=1)
         else:
@@ -113,11 +148,18 @@ class MCTSAgent(Agent):
         The more simulations run, the larger the depth of the resulting tree and values
         should more likely converge.
         """
+        if self.threads > 1:
+            return self.runThreadedMCTS(gameState)
+        if self.leaf_batch > 0:
+            return self.runBatchedMCTS(gameState)
+
         start_time = time.time()
         num_simulations = 0
         num_survived = 0
         num_selected = Counter()
 
+        playout_state = PlayoutState(gameState)
+
         def should_stop():
             if self.time_limit != None and time.time() - start_time > self.time_limit:
                 return True
@@ -131,8 +173,9 @@ class MCTSAgent(Agent):
             actions = self.get_actions(leaf_node)
             if DEBUG:
                 num_selected[actions[0]] += 1
-            (sim_result, relevant_node) = self.simulate(gameState.deepCopy(), actions, leaf_node)
+            (sim_result, relevant_node) = self.simulate(playout_state, actions, leaf_node)
             result = self.evaluate(*sim_result)
+            playout_state.rewind()
             num_simulations += 1
             if result[0] == 1:
                 num_survived += 1
@@ -141,6 +184,124 @@ class MCTSAgent(Agent):
         self.tactic = self.get_tactic(gameState, num_survived / num_simulations if num_simulations > 0 else 0)
         
         debug(num_selected)
+
+        return num_simulations, num_survived
+
+    def runBatchedMCTS(self, gameState):
+        """
+        Leaf parallelisation: every selected leaf is evaluated with a batch of
+        leaf_batch playouts run in lockstep by PlayoutBatch, and the batch is
+        backpropagated at once. The playouts use a vectorized version of the
+        simulation strategy.
+        """
+        start_time = time.time()
+        num_simulations = 0
+        num_survived = 0
+        batch = PlayoutBatch(PlayoutState(gameState), self.leaf_batch, self.simulation_length,
+                             np.random.default_rng(random.getrandbits(32)),
+                             directional_ghosts=self.ghost_type == 'DirectionalGhost',
+                             random_moves=not self.should_use_simulation_strategy)
+
+        def should_stop():
+            if self.time_limit != None and time.time() - start_time > self.time_limit:
+                return True
+            if self.num_simulations != None and num_simulations >= self.num_simulations:
+                return True
+            return False
+
+        while not should_stop():
+            self.tactic = self.get_tactic(gameState, num_survived / num_simulations if num_simulations > 0 else 0)
+            leaf_node = self.select()
+            actions = self.get_actions(leaf_node)
+            survival, pill, ghost = self.evaluate_batch(*batch.run(actions))
+            num_simulations += self.leaf_batch
+            num_survived += int(survival.sum())
+            self.backpropagate(leaf_node, (survival.sum(), pill.sum(), ghost.sum()), self.leaf_batch)
+
+        self.tactic = self.get_tactic(gameState, num_survived / num_simulations if num_simulations > 0 else 0)
+
+        return num_simulations, num_survived
+
+    def runThreadedMCTS(self, gameState):
+        """
+        Tree parallelisation: several threads select, simulate and backpropagate on
+        the shared tree. Tree operations happen under a lock while the simulations
+        run outside of it, so the speedup depends on the interpreter running the
+        threads in parallel (free-threaded CPython). Until its result is
+        backpropagated, a selected path carries a virtual loss that steers the
+        other threads towards different leaves.
+        """
+        start_time = time.time()
+        lock = threading.Lock()
+        counts = {'started': 0, 'simulations': 0, 'survived': 0}
+        errors = []
+        playout_state = PlayoutState(gameState)
+
+        def should_stop():
+            if self.time_limit != None and time.time() - start_time > self.time_limit:
+                return True
+            if self.num_simulations != None and counts['started'] >= self.num_simulations:
+                return True
+            return False
+
+        def search():
+            ghost_agent = copy.copy(self.simulated_ghost_agent)
+            thread_state = playout_state.copy()
+            try:
+                while True:
+                    with lock:
+                        if should_stop():
+                            return
+                        counts['started'] += 1
+                        self.tactic = self.get_tactic(gameState, counts['survived'] / counts['simulations'] if counts['simulations'] > 0 else 0)
+                        leaf_node = self.select()
+                        actions = self.get_actions(leaf_node)
+                        self.tree.pool.add_virtual_loss(leaf_node.index, self.tree.root.index, self.virtual_loss)
+                    (sim_result, relevant_node) = self.simulate(thread_state, actions, leaf_node, ghost_agent)
+                    result = self.evaluate(*sim_result)
+                    thread_state.rewind()
+                    with lock:
+                        self.tree.pool.add_virtual_loss(leaf_node.index, self.tree.root.index, -self.virtual_loss)
+                        counts['simulations'] += 1
+                        if result[0] == 1:
+                            counts['survived'] += 1
+                        self.backpropagate(relevant_node, result)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=search) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        num_simulations = counts['simulations']
+        num_survived = counts['survived']
+        self.tactic = self.get_tactic(gameState, num_survived / num_simulations if num_simulations > 0 else 0)
+        return num_simulations, num_survived
+
+    def runParallelMCTS(self, gameState):
+        """
+        Root parallelisation: the worker processes search from the same state with
+        their own trees and random streams while this process searches its own tree.
+        The statistics of the top two levels of every tree are then merged into
+        this one, which is enough for the children values used to choose a move.
+        """
+        pool = get_worker_pool(self.workers - 1)
+        seeds = [random.getrandbits(32) for _ in range(self.workers - 1)]
+        results = [pool.apply_async(search_worker, (self.worker_args, gameState, self.num_pills, seed)) for seed in seeds]
+
+        num_simulations, num_survived = self.runMCTS(gameState)
+        for result in results:
+            worker_simulations, worker_survived, statistics = result.get()
+            num_simulations += worker_simulations
+            num_survived += worker_survived
+            self.tree.merge_statistics(statistics)
+
+        self.tactic = self.get_tactic(gameState, num_survived / num_simulations if num_simulations > 0 else 0)
+        return num_simulations, num_survived
             
     def getAction(self, gameState):
         """
@@ -151,7 +312,10 @@ class MCTSAgent(Agent):
             self.tree = PacmanTree(gameState)
             self.num_pills = gameState.getNumFood()
         self.reuse_tree(gameState)
-        self.runMCTS(gameState)
+        if self.workers > 1:
+            self.runParallelMCTS(gameState)
+        else:
+            self.runMCTS(gameState)
         # print results
         if DEBUG:
             self.tree.root.print_stats(limit=2)
@@ -161,22 +325,24 @@ class MCTSAgent(Agent):
                   child.get_value(self.tactic), self.tactic)
         self.prev_state = gameState
 
+        pool = self.tree.pool
+        root = self.tree.root.index
+        children, means = pool.child_means(root)
+        survival_values = [tactic_value(child_means, Tactic.SURVIVAL) for child_means in means]
         if self.use_tactics:
             ordered_tactics = [self.tactic, Tactic.GHOST, Tactic.PILL, Tactic.SURVIVAL]
 
             for tactic in ordered_tactics:
-                filtered_children = []
-                for child in self.tree.root.children:
-                    if child.get_value(tactic) > 0 and child.get_value(Tactic.SURVIVAL) > self.survival_threshold:
-                        filtered_children.append(child)
+                values = [tactic_value(child_means, tactic) for child_means in means]
+                filtered_children = [i for i in range(len(children)) if values[i] > 0 and survival_values[i] > self.survival_threshold]
                 if len(filtered_children) > 0:
-                    best_child = max(filtered_children, key=lambda x: x.get_value(tactic))
+                    best_child = max(filtered_children, key=values.__getitem__)
                     self.tactic = tactic
-                    action = best_child.actions[0]
+                    action = pool.node(children[best_child]).actions[0]
                     debug('Action:', action, 'Tactic:', tactic)
                     return action
-        action = max(self.tree.root.children,
-                     key=lambda x: x.get_value(Tactic.SURVIVAL)).actions[0]
+        best_child = max(range(len(children)), key=survival_values.__getitem__)
+        action = pool.node(children[best_child]).actions[0]
         debug('Action:', action, 'Tactic:', Tactic.SURVIVAL)
         return action
 
@@ -204,8 +370,7 @@ class MCTSAgent(Agent):
                 ghost_y = math.floor(
                     ghost_y) if ghost_y < pos[1] else math.ceil(ghost_y)
                 ghost_pos = (ghost_x, ghost_y)
-                distance, actions = self.tree.maze_distance(
-                    gameState.getPacmanPosition(), ghost_pos)
+                distance = self.tree.distance(gameState.getPacmanPosition(), ghost_pos)
                 # Check if the ghost is reachable
                 if distance < ghost.scaredTimer:
                     return Tactic.GHOST
@@ -241,18 +406,22 @@ class MCTSAgent(Agent):
         Expands the tree, updates visit values here, and returns the expanded node
         """
         pos, actions = successor
-        child = MCTNode(pos, actions)
+        child = self.tree.new_node(pos, actions)
         node.addChild(child)
         return child
     
     # Simulation
-    def simulate(self, gameState, actions, leaf_node):
+    def simulate(self, gameState, actions, leaf_node, ghost_agent=None):
         """
         After expansion, let the agent play out randomly or by some method.
         The simulation stops once a certain amount of timesteps have passed or
-        we reach a terminal state.
+        we reach a terminal state. The moves are pushed on gameState, which the
+        caller rewinds once the result is evaluated.
         """
 
+        if ghost_agent == None:
+            ghost_agent = self.simulated_ghost_agent
+
         ghost_eaten_remaining_time = 0
         is_selection = True
         ate_capsule = False
@@ -310,12 +479,12 @@ class MCTSAgent(Agent):
 
             try:
                 prev_state = gameState
-                gameState = gameState.generateSuccessor(0, action, copy=False)
+                gameState.push_move(0, action)
                 for i in range(1, gameState.getNumAgents()-1):
                     if gameState.isLose() or gameState.isWin():
                         break
-                    self.simulated_ghost_agent.index = i
-                    gameState = gameState.generateSuccessor(i, self.simulated_ghost_agent.getAction(gameState), copy=False)
+                    ghost_agent.index = i
+                    gameState.push_move(i, ghost_agent.getAction(gameState))
             except Exception as e:
                 debug(e)
                 debug(gameState)
@@ -362,43 +531,63 @@ class MCTSAgent(Agent):
 
         return (survival_reward, pill_reward, ghost_reward)
 
+    def evaluate_batch(self, lose, ghost_eaten_remaining_time, num_food_eaten, ate_capsule):
+        """
+        Same as evaluate, for arrays of playout results. Returns an array per reward.
+        """
+
+        survival_reward = np.where(lose, 0.0, 1.0)
+        pill_reward = num_food_eaten / self.num_pills if self.num_pills > 0 else np.zeros(len(lose))
+        ghost_reward = ghost_eaten_remaining_time / SCARED_TIME
+
+        if self.use_long_term_goals:
+            pill_reward = np.where(ate_capsule, np.where(ghost_reward >= 0.5, pill_reward + ghost_reward, 0.0), pill_reward)
+
+        return (survival_reward, pill_reward, ghost_reward)
+
 
             
     # Backpropagation
-    def backpropagate(self, node, result):
+    def backpropagate(self, node, result, visits=1):
         """
         All the nodes in the tree that are involved in the simulation have
-        their statistics updated afterwards.
+        their statistics updated afterwards. A batch of playouts is passed as
+        the totals of its rewards along with the number of playouts.
         """
 
-        while True: # update stats
-            node.visits += 1
-            node.rewards[Tactic.SURVIVAL] += result[0]
-            node.rewards[Tactic.PILL] += result[1]
-            node.rewards[Tactic.GHOST] += result[2]
+        pool = self.tree.pool
+        root = self.tree.root.index
+        index = node.index
+        while True: # update stats, along with the cached best means of the parent
+            pool.update(index, result[0], result[1], result[2], visits)
             
-            if node == self.tree.root:
+            if index == root:
                 return
 
-            node = node.parent
+            index = pool.parent[index]
         
 
-    def uct_score(self, node):
+    def uct_scores(self, node):
         """
-        Updates and returns the UCT score of a node
+        Returns the children of a node along with their UCT scores
         """
-        score = node.get_value(self.tactic)
+        pool = self.tree.pool
+        children, scores = pool.child_values(node.index, self.tactic)
         c = math.sqrt(2)
-        explore = math.sqrt(math.log(node.parent.visits) / node.visits)
-        
-        return score + (c * explore)
+        log_visits = math.log(pool.node_visits(node.index))
+        for i, child in enumerate(children):
+            explore = math.sqrt(log_visits / pool.node_visits(child))
+            scores[i] += c * explore
+        return children, scores
         
     def best_child(self, node, option='max'):
         """
         Returns the best child of a node
         """
         if option == 'max':
-            return max(node.children, key=lambda child: self.uct_score(child))
+            children, scores = self.uct_scores(node)
+            best = max(range(len(children)), key=scores.__getitem__)
+            return self.tree.pool.node(children[best])
         elif option == 'visits':
             return max(node.children, key=lambda child: child.visits)
     
@@ -450,7 +639,6 @@ class MCTSAgent(Agent):
         pos = currentGameState.getPacmanPosition()
         is_junction = self.tree.is_junction(currentGameState.getPacmanPosition())
 
-        food = currentGameState.getFood()
         capsules = currentGameState.getCapsules()
 
         unscared_ghost_positions = [ghost.getPosition() for ghost in currentGameState.getGhostStates() if not ghost.scaredTimer > 0]
@@ -458,21 +646,15 @@ class MCTSAgent(Agent):
 
         if is_junction:
             # Find the safe moves
-            successors = self.tree.successors(currentGameState.getPacmanPosition())
+            successors = self.tree.successors(pos)
+            successor_cells = self.tree.successor_cells(pos)
             safe_moves = []
             safe_successors = []
-            for end_pos, actions in successors:
-                current_pos = pos
-                path = []
-                is_safe = True
-                action_index = 0
-                while current_pos != end_pos:
-                    if any(GhostRules.canKill(current_pos, ghost_pos) for ghost_pos in unscared_ghost_positions):
-                        is_safe = False
-                        break
-                    path.append(current_pos)
-                    current_pos = self.tree.next_position(current_pos, actions[action_index])
-                    action_index += 1
+            for (end_pos, actions), cells in zip(successors, successor_cells):
+                # The positions from the junction up to the next one, which an edge
+                # leading back to this junction doesn't have
+                path = [pos] + list(cells[:-1]) if end_pos != pos else []
+                is_safe = not any(GhostRules.canKill(current_pos, ghost_pos) for current_pos in path for ghost_pos in unscared_ghost_positions)
                 if is_safe:
                     # Check if any ghost can reach the junction before Pacman
                     for ghost in currentGameState.getGhostStates():
@@ -482,7 +664,7 @@ class MCTSAgent(Agent):
                             ghost_x = math.floor(ghost_x) if ghost_x > end_pos[0] else math.ceil(ghost_x)
                             ghost_y = math.floor(ghost_y) if ghost_y > end_pos[1] else math.ceil(ghost_y)
                             ghost_pos = (ghost_x, ghost_y)
-                            if self.tree.maze_distance(ghost_pos, end_pos)[0] <= len(actions) <= len(actions) + COLLISION_TOLERANCE:
+                            if self.tree.distance(ghost_pos, end_pos) <= len(actions) <= len(actions) + COLLISION_TOLERANCE:
                                 is_safe = False
                                 break
                 if is_safe:
@@ -507,7 +689,7 @@ class MCTSAgent(Agent):
             # Check if there are any pills along the paths to the successor junctions
             for pos, actions, path in safe_successors:
                 for next_pos in path:
-                    if food[next_pos[0]][next_pos[1]] or next_pos in capsules:
+                    if currentGameState.hasFood(*next_pos) or next_pos in capsules:
                         return actions[0]
 
             # If all safe edges are cleared, select a random move leading to a safe edge
@@ -522,16 +704,19 @@ class MCTSAgent(Agent):
 
         else:
             # If there is a non edible ghost on the current path, reverse
-            current_pos = pos
-            action = currentGameState.getPacmanState().configuration.direction
-            while not self.tree.is_junction(current_pos) and len(self.tree.get_legal_actions(current_pos)) > 1:
-                # Get the available direction to move that is not the reverse of the previous move
-                action = [direction for direction in self.tree.get_legal_actions(current_pos) if direction != self.opposite(action)][0]
-                current_pos = self.tree.next_position(current_pos, action)
+            ahead = []
+            if not self.tree.is_junction(pos) and len(self.tree.get_legal_actions(pos)) > 1:
+                # Follow the edge in the current direction, up to the next junction
+                first_action = [direction for direction in self.tree.get_legal_actions(pos) if direction != self.opposite(currentGameState.getPacmanState(copy=False).configuration.direction)][0]
+                for (end_pos, actions), cells in zip(self.tree.successors(pos), self.tree.successor_cells(pos)):
+                    if actions[0] == first_action:
+                        ahead = zip(cells, actions)
+                        break
+            for current_pos, action in ahead:
                 dangerous_ghosts = [ghost for ghost in currentGameState.getGhostStates() if ghost.scaredTimer == 0]
                 for ghost in dangerous_ghosts:
                     if GhostRules.canKill(current_pos, ghost.getPosition()) and ghost.configuration.direction == self.opposite(action):
-                        opposite_direction = self.opposite(currentGameState.getPacmanState().configuration.direction)
+                        opposite_direction = self.opposite(currentGameState.getPacmanState(copy=False).configuration.direction)
                         if opposite_direction in self.tree.get_legal_actions(pos):
                             return opposite_direction
                         else:
@@ -540,5 +725,5 @@ class MCTSAgent(Agent):
                 if current_pos in currentGameState.getCapsules():
                     break
             if len(self.tree.get_legal_actions(pos)) > 1:
-                return [direction for direction in self.tree.get_legal_actions(pos) if direction != self.opposite(currentGameState.getPacmanState().configuration.direction)][0]
+                return [direction for direction in self.tree.get_legal_actions(pos) if direction != self.opposite(currentGameState.getPacmanState(copy=False).configuration.direction)][0]
             return self.tree.get_legal_actions(pos)[0]
@@ -0,0 +1,71 @@
+"""
+Measures how the simulations per second of MCTSAgent scale with the number of
+threads searching the same tree (tree parallelisation with virtual loss), or
+with the size of the playout batches of the leaf-parallel mode.
+
+Usage: python measure_scaling.py [-l LAYOUT] [-t TIME] [-k GHOSTS] [-r REPEATS] [--threads 1,2,4,8] [--leaf-batch 0,16,64]
+"""
+
+import argparse
+import random
+import sys
+import time
+import layout
+from pacman import GameState
+from mctsAgents import MCTSAgent
+from PacmanTree import PacmanTree
+
+
+def measure(gameState, threads, time_limit, repeats, leaf_batch=0):
+    # Run a fresh search from the same state several times and return the simulations per second
+    agent = MCTSAgent(threads=str(threads), time_limit=str(time_limit), leaf_batch=str(leaf_batch))
+    agent.tree = PacmanTree(gameState)
+    agent.num_pills = gameState.getNumFood()
+    total_simulations = 0
+    total_time = 0
+    for _ in range(repeats):
+        agent.tree.reset(gameState)
+        start_time = time.time()
+        num_simulations, _ = agent.runMCTS(gameState)
+        total_time += time.time() - start_time
+        total_simulations += num_simulations
+    return total_simulations / total_time
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Measure the simulations per second of MCTSAgent for different numbers of threads')
+    parser.add_argument('-l', '--layout', default='layouts/gen_large/large0_spatial.lay', help='layout to search on')
+    parser.add_argument('-t', '--time', default=2.0, type=float, help='seconds to search for at each measurement')
+    parser.add_argument('-k', '--ghosts', default=4, type=int, help='maximum number of ghosts')
+    parser.add_argument('-r', '--repeats', default=3, type=int, help='number of searches to average over')
+    parser.add_argument('--threads', default='1,2,4,8', help='comma separated numbers of threads to measure')
+    parser.add_argument('--leaf-batch', default=None, help='comma separated playout batch sizes to measure instead of threads')
+    args = parser.parse_args(argv)
+
+    game_layout = layout.getLayout(args.layout)
+    if game_layout == None:
+        raise Exception("The layout " + args.layout + " cannot be found")
+    gameState = GameState()
+    gameState.initialize(game_layout, args.ghosts)
+
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f'Layout: {args.layout}, GIL enabled: {is_gil_enabled}')
+    if args.leaf_batch != None:
+        print('  Batch | Simulations/s | Speedup')
+        settings = [(1, int(n)) for n in args.leaf_batch.split(',')]
+    else:
+        print('Threads | Simulations/s | Speedup')
+        settings = [(int(n), 0) for n in args.threads.split(',')]
+    baseline = None
+    for threads, leaf_batch in settings:
+        random.seed(0)
+        rate = measure(gameState, threads, args.time, args.repeats, leaf_batch)
+        if baseline == None:
+            baseline = rate
+        # Rows are labelled with the setting being measured, batch 0 being sequential playouts
+        label = leaf_batch if args.leaf_batch != None else threads
+        print(f'{label:7d} | {rate:13.1f} | {rate / baseline:6.2f}x')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
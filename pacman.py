@@ -43,6 +43,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import Zobrist
 from util import nearestPoint
 from util import manhattanDistance
 import util
@@ -120,6 +122,11 @@ class GameState:
             self.data._win = False
             self.data.scoreChange = 0
 
+        # The moving agent's keys are swapped around its move and the timer;
+        # the rules update the hash for the food, capsules and other agents
+        agentState = state.data.agentStates[agentIndex]
+        state.data._hash ^= Zobrist.agent(agentIndex, agentState)
+
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
             state.data._eaten = [False for i in range(state.getNumAgents())]
@@ -131,7 +138,8 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(agentState)
+        state.data._hash ^= Zobrist.agent(agentIndex, agentState)
 
         # Resolve multi-agent effects
         GhostRules.checkDeath(state, agentIndex)
@@ -141,6 +149,33 @@ class GameState:
         state.data.score += state.data.scoreChange
         return state
 
+    def push_move(self, agentIndex, action):
+        """
+        Applies an action to this state in place, like generateSuccessor with
+        copy=False, and returns the undo record that pop_move uses to take the
+        move back. Moves can be pushed and popped in stack order.
+        """
+        record = self.data.pushUndo()
+        try:
+            self.generateSuccessor(agentIndex, action, copy=False)
+        except:
+            self.data.popUndo()
+            raise
+        return record
+
+    def pop_move(self):
+        """
+        Takes back the last move applied with push_move.
+        """
+        return self.data.popUndo()
+
+    def rewind(self):
+        """
+        Takes back every move applied with push_move.
+        """
+        while len(self.data._undoLog) > 0:
+            self.data.popUndo()
+
     def getLegalPacmanActions(self):
         return self.getLegalActions(0)
 
@@ -150,13 +185,18 @@ class GameState:
         """
         return self.generateSuccessor(0, action)
 
-    def getPacmanState(self):
+    def getPacmanState(self, copy=True):
         """
         Returns an AgentState object for pacman (in game.py)
 
         state.pos gives the current position
         state.direction gives the travel vector
+
+        With copy=False the state itself is returned, which is faster but must
+        be treated as read-only.
         """
+        if not copy:
+            return self.data.agentStates[0]
         return self.data.agentStates[0].copy()
 
     def getPacmanPosition(self):
@@ -191,7 +231,7 @@ class GameState:
         return self.data.capsules
 
     def getNumFood(self):
-        return self.data.food.count()
+        return self.data.numFood
 
     def getFood(self):
         """
@@ -364,14 +404,14 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getPacmanState().configuration, state.data.layout.walls)
+        return list(state.data.layout.moveTables.getPacmanActions(state.data.agentStates[0].configuration))
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
         """
         Edits the state to reflect the results of the action.
         """
-        legal = PacmanRules.getLegalActions(state)
+        legal = state.data.layout.moveTables.getPacmanActions(state.data.agentStates[0].configuration)
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
@@ -395,21 +435,27 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
+            if not state.data._foodOwned:
+                # Copy on write: the food is shared with another state
+                state.data.food = state.data.food.copy()
+                state.data._foodOwned = True
             state.data.food[x][y] = False
+            state.data._hash ^= Zobrist.food(x, y)
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            state.data.numFood -= 1
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if(position in state.getCapsules()):
             state.data.capsules.remove(position)
             state.data._capsuleEaten = position
+            state.data._hash ^= Zobrist.capsule(position)
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
+                state.data._hash ^= Zobrist.agent(index, state.data.agentStates[index])
                 state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data._hash ^= Zobrist.agent(index, state.data.agentStates[index])
     consume = staticmethod(consume)
 
 
@@ -425,19 +471,12 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
-        if Directions.STOP in possibleActions:
-            possibleActions.remove(Directions.STOP)
-        if reverse in possibleActions and len(possibleActions) > 1:
-            possibleActions.remove(reverse)
-        return possibleActions
+        return list(state.data.layout.moveTables.getGhostActions(conf))
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action, ghostIndex):
 
-        legal = GhostRules.getLegalActions(state, ghostIndex)
+        legal = state.data.layout.moveTables.getGhostActions(state.data.agentStates[ghostIndex].configuration)
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
@@ -453,8 +492,8 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            ghostState.configuration = Configuration(nearestPoint(
+                ghostState.configuration.pos), ghostState.configuration.direction)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
@@ -476,8 +515,10 @@ class GhostRules:
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            state.data._hash ^= Zobrist.agent(agentIndex, ghostState)
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
+            state.data._hash ^= Zobrist.agent(agentIndex, ghostState)
             # Added for first-person
             state.data._eaten[agentIndex] = True
         else:
@@ -0,0 +1,276 @@
+"""
+Batched playouts for the leaf-parallel mode of the MCTSAgent.
+
+A PlayoutBatch runs many playouts from the same state in lockstep, with every
+playout stored as a row of NumPy arrays: agent positions, headings and scared
+timers, and the food and capsules left. Positions are kept in half-cell
+coordinates (X = 2 * x, Y = 2 * y) so that scared ghosts, which move half a
+cell per turn, stay on integers. The legal moves come from tables built once
+per layout from the tables of PlayoutRules.
+
+Pacman follows the tree actions while the playout is still in the selection
+phase, then a vectorized version of the simulation strategy: keep going along
+the current edge, pick a random move at junctions, and avoid moves that run
+into a nonedible ghost (reversing if need be). With random_moves, Pacman picks
+any legal move at random instead, like simulate does without the simulation
+strategy. The ghosts are RandomGhosts or DirectionalGhosts.
+"""
+
+import numpy as np
+
+from game import Directions, Actions
+from pacman import SCARED_TIME
+from playoutState import PlayoutRules
+
+# Direction indices follow Actions._directionsAsList
+DIRECTIONS = [direction for direction, vector in Actions._directionsAsList]
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+STOP = DIRECTION_INDEX[Directions.STOP]
+REVERSE = np.array([DIRECTION_INDEX[Directions.REVERSE[direction]] for direction in DIRECTIONS])
+DX = np.array([vector[0] for direction, vector in Actions._directionsAsList])
+DY = np.array([vector[1] for direction, vector in Actions._directionsAsList])
+
+# Half-cell distance within which a ghost touches Pacman (COLLISION_TOLERANCE is 0.7 cells)
+COLLISION_DISTANCE = 1
+# Half-cell distance from which a nonedible ghost can touch Pacman after its next move
+DANGER_DISTANCE = 3
+
+DIRECTIONAL_PROB = 0.8 # prob_attack and prob_scaredFlee of DirectionalGhost
+
+
+class BatchRules():
+    """
+    Move tables of a layout over half-cell positions P = X * 2 * height + Y,
+    kept with the layout (layout.getAnalysis(BatchRules)).
+    """
+
+    def __init__(self, layout):
+        rules = layout.getAnalysis(PlayoutRules)
+        width, height = rules.width, rules.height
+        self.rules = rules
+        self.stride = 2 * height
+        num_positions = 2 * width * self.stride
+        positions = np.arange(num_positions)
+        self.X = positions // self.stride
+        self.Y = positions % self.stride
+        # Position change of half a cell in each direction
+        self.delta = DX * self.stride + DY
+
+        # Grid cell of each position, used for the food of Pacman who stays on grid points
+        self.cell = (self.X // 2) * height + self.Y // 2
+        # Nearest grid point, as used by AgentState when a ghost stops being scared
+        self.snap = (self.X + self.X % 2) * self.stride + self.Y + self.Y % 2
+
+        # Moves of a ghost by position and heading: no stopping or reversing
+        # unless forced, and going straight on between grid points. Pacman
+        # follows the same moves along an edge.
+        self.moves = np.zeros((num_positions, len(DIRECTIONS), 4), dtype=np.intp)
+        self.num_moves = np.ones((num_positions, len(DIRECTIONS)), dtype=np.intp)
+        self.moves[:, :, 0] = np.arange(len(DIRECTIONS))
+        # Legal moves of Pacman, stopping included
+        self.legal = np.zeros((num_positions, len(DIRECTIONS)), dtype=bool)
+        self.legal_moves = np.zeros((num_positions, len(DIRECTIONS)), dtype=np.intp)
+        self.num_legal = np.ones(num_positions, dtype=np.intp)
+        self.legal_moves[:, 0] = STOP
+        for cell, actions in rules.pacman_actions.items():
+            position = 2 * (cell // height) * self.stride + 2 * (cell % height)
+            indices = [DIRECTION_INDEX[action] for action in actions]
+            self.legal[position, indices] = True
+            self.legal_moves[position, :len(indices)] = indices
+            self.num_legal[position] = len(indices)
+            for heading in DIRECTIONS:
+                indices = [DIRECTION_INDEX[action] for action in rules.ghost_actions[(cell, heading)]]
+                self.moves[position, DIRECTION_INDEX[heading], :len(indices)] = indices
+                self.num_moves[position, DIRECTION_INDEX[heading]] = len(indices)
+
+    def position(self, pos):
+        return int(round(2 * pos[0])) * self.stride + int(round(2 * pos[1]))
+
+
+def choose(mask, u):
+    """
+    Picks one True column per row of mask, uniformly at random given the
+    uniform samples u. Rows without any True column get column 0.
+    """
+    counts = mask.sum(axis=1)
+    rank = np.minimum((u * counts).astype(np.intp), np.maximum(counts - 1, 0))
+    return np.argmax(np.cumsum(mask, axis=1) > rank[:, None], axis=1)
+
+
+class PlayoutBatch():
+    """
+    Runs batches of playouts from one PlayoutState.
+    """
+
+    def __init__(self, playoutState, size, length, rng, directional_ghosts=False, random_moves=False):
+        rules = playoutState.rules.layout.getAnalysis(BatchRules)
+        self.rules = rules
+        self.size = size
+        self.length = length
+        self.rng = rng
+        self.directional_ghosts = directional_ghosts
+        self.random_moves = random_moves
+
+        agents = playoutState.agents
+        self.positions = np.array([rules.position(agent.pos) for agent in agents])
+        self.headings = np.array([DIRECTION_INDEX[agent.direction] for agent in agents])
+        self.timers = np.array([agent.scaredTimer for agent in agents])
+        self.starts = np.array([rules.position(agent.start) for agent in agents])
+        num_cells = rules.rules.width * rules.rules.height
+        food_bytes = playoutState.food.to_bytes((num_cells + 7) // 8, 'little')
+        self.food = np.unpackbits(np.frombuffer(food_bytes, dtype=np.uint8), bitorder='little')[:num_cells].astype(bool)
+        self.num_food = playoutState.getNumFood()
+        self.capsules = np.array([rules.position(capsule) for capsule in playoutState.getCapsules()], dtype=np.intp)
+
+    def run(self, actions):
+        """
+        Plays out the batch, starting with the given Pacman actions. Returns one
+        array per argument of MCTSAgent.evaluate: whether Pacman lost, the time
+        left on the ghosts eaten, the number of pills eaten and whether a power
+        pill was eaten.
+        """
+        rules = self.rules
+        rng = self.rng
+        size = self.size
+        rows = np.arange(size)
+        X, Y, delta = rules.X, rules.Y, rules.delta
+        num_agents = len(self.positions)
+
+        positions = np.tile(self.positions, (size, 1))
+        headings = np.tile(self.headings, (size, 1))
+        timers = np.tile(self.timers, (size, 1))
+        food = np.tile(self.food, (size, 1))
+        num_food = np.full(size, self.num_food)
+        capsules = np.ones((size, len(self.capsules)), dtype=bool)
+
+        win = np.zeros(size, dtype=bool)
+        lose = np.zeros(size, dtype=bool)
+        stopped = np.zeros(size, dtype=bool)
+        selecting = np.ones(size, dtype=bool)
+        ghost_time = np.zeros(size)
+        ate_capsule = np.zeros(size, dtype=bool)
+
+        actions = [DIRECTION_INDEX[action] for action in actions]
+        for step in range(self.length):
+            active = ~(win | lose | stopped)
+            if not active.any():
+                break
+            turn_timers = timers.copy()
+
+            # Pacman
+            pacman = positions[:, 0]
+            heading = headings[:, 0]
+            if step < len(actions):
+                selecting &= rules.legal[pacman, actions[step]]
+            else:
+                selecting[:] = False
+            action = self.pacman_moves(positions, headings, timers)
+            if step < len(actions):
+                action = np.where(selecting, actions[step], action)
+            pacman = np.where(active, pacman + 2 * delta[action], pacman)
+            positions[:, 0] = pacman
+            headings[:, 0] = np.where(active & (action != STOP), action, heading)
+
+            cell = rules.cell[pacman]
+            eats = active & food[rows, cell]
+            food[rows[eats], cell[eats]] = False
+            num_food -= eats
+            win |= eats & (num_food == 0) & ~lose
+
+            if len(self.capsules) > 0:
+                eaten = active[:, None] & capsules & (pacman[:, None] == self.capsules[None, :])
+                eats = eaten.any(axis=1)
+                capsules &= ~eaten
+                edible = (turn_timers[:, 1:] > 0).any(axis=1)
+                # Eating a power pill while the ghosts are edible ends the playout
+                stopped |= eats & edible
+                ate_capsule |= eats & ~edible
+                selecting &= ~eats
+                timers[:, 1:] = np.where(eats[:, None], SCARED_TIME, timers[:, 1:])
+
+            for ghost in range(1, num_agents):
+                self.collide(ghost, active, positions, headings, timers, turn_timers, win, lose, selecting, ghost_time)
+
+            # Ghosts
+            for ghost in range(1, num_agents):
+                moving = active & ~(win | lose)
+                position = positions[:, ghost]
+                scared = timers[:, ghost] > 0
+                speed = np.where(scared, 1, 2)
+                action = self.ghost_moves(ghost, positions, headings, scared, speed)
+                position = np.where(moving, position + speed * delta[action], position)
+                headings[:, ghost] = np.where(moving, action, headings[:, ghost])
+                timer = timers[:, ghost]
+                position = np.where(moving & (timer == 1), rules.snap[position], position)
+                positions[:, ghost] = position
+                timers[:, ghost] = np.where(moving, np.maximum(0, timer - 1), timer)
+                self.collide(ghost, moving, positions, headings, timers, turn_timers, win, lose, selecting, ghost_time)
+
+        return lose, ghost_time, self.num_food - num_food, ate_capsule
+
+    def collide(self, ghost, active, positions, headings, timers, turn_timers, win, lose, selecting, ghost_time):
+        # Same outcome as GhostRules.collide, for the rows where the ghost touches Pacman
+        X, Y = self.rules.X, self.rules.Y
+        pacman = positions[:, 0]
+        position = positions[:, ghost]
+        touching = active & (np.abs(X[position] - X[pacman]) + np.abs(Y[position] - Y[pacman]) <= COLLISION_DISTANCE)
+        eaten = touching & (timers[:, ghost] > 0)
+        ghost_time += np.where(eaten, turn_timers[:, ghost], 0)
+        selecting &= ~eaten
+        positions[:, ghost] = np.where(eaten, self.starts[ghost], position)
+        headings[:, ghost] = np.where(eaten, STOP, headings[:, ghost])
+        timers[:, ghost] = np.where(eaten, 0, timers[:, ghost])
+        lose |= touching & ~eaten & ~win
+
+    def pacman_moves(self, positions, headings, timers):
+        rules = self.rules
+        u = self.rng.random(self.size)
+        pacman = positions[:, 0]
+        if self.random_moves:
+            rank = np.minimum((u * rules.num_legal[pacman]).astype(np.intp), rules.num_legal[pacman] - 1)
+            return rules.legal_moves[pacman, rank]
+
+        heading = headings[:, 0]
+        moves = rules.moves[pacman, heading]
+        valid = np.arange(4)[None, :] < rules.num_moves[pacman, heading][:, None]
+
+        # A move is unsafe if a nonedible ghost can reach its end in one move
+        X, Y = rules.X, rules.Y
+        ghosts = positions[:, 1:]
+        nonedible = timers[:, 1:] == 0
+        end_x = X[pacman][:, None] + 2 * DX[moves]
+        end_y = Y[pacman][:, None] + 2 * DY[moves]
+        distances = np.abs(end_x[:, :, None] - X[ghosts][:, None, :]) + np.abs(end_y[:, :, None] - Y[ghosts][:, None, :])
+        unsafe = ((distances <= DANGER_DISTANCE) & nonedible[:, None, :]).any(axis=2)
+        safe = valid & ~unsafe
+
+        # Without a safe move ahead, turn back if that is safe
+        reverse = REVERSE[heading]
+        reverse_x = X[pacman] + 2 * DX[reverse]
+        reverse_y = Y[pacman] + 2 * DY[reverse]
+        reverse_distances = np.abs(reverse_x[:, None] - X[ghosts]) + np.abs(reverse_y[:, None] - Y[ghosts])
+        reverse_safe = rules.legal[pacman, reverse] & (heading != STOP) & ~((reverse_distances <= DANGER_DISTANCE) & nonedible).any(axis=1)
+
+        any_safe = safe.any(axis=1)
+        choice = moves[np.arange(self.size), choose(np.where(any_safe[:, None], safe, valid), u)]
+        return np.where(~any_safe & reverse_safe, reverse, choice)
+
+    def ghost_moves(self, ghost, positions, headings, scared, speed):
+        rules = self.rules
+        position = positions[:, ghost]
+        heading = headings[:, ghost]
+        moves = rules.moves[position, heading]
+        valid = np.arange(4)[None, :] < rules.num_moves[position, heading][:, None]
+        u = self.rng.random(self.size)
+        if self.directional_ghosts:
+            # Rush Pacman, or flee when scared, along the moves with the best distance
+            X, Y = rules.X, rules.Y
+            pacman = positions[:, 0]
+            distances = (np.abs(X[position][:, None] + speed[:, None] * DX[moves] - X[pacman][:, None]) +
+                         np.abs(Y[position][:, None] + speed[:, None] * DY[moves] - Y[pacman][:, None]))
+            distances = np.where(scared[:, None], distances, -distances)
+            distances = np.where(valid, distances, -np.inf)
+            best = valid & (distances == distances.max(axis=1)[:, None])
+            v = self.rng.random(self.size)
+            valid = np.where((v < DIRECTIONAL_PROB)[:, None], best, valid)
+        return moves[np.arange(self.size), choose(valid, u)]
@@ -0,0 +1,298 @@
+"""
+A compact game state for the playouts of the MCTSAgent.
+
+PlayoutState implements the same rules as GameState with PacmanRules and
+GhostRules (see pacman.py), along with the part of the GameState interface used
+by the simulations, the simulation strategy and the ghost agents. Cells are
+numbered x * height + y, the food is a bitmask over the cell numbers and the
+legal moves come from tables built once per layout, so copying a state only
+copies a few small agent records.
+"""
+
+from game import Directions, Actions
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY, PacmanRules, GhostRules
+
+PACMAN_SPEED = PacmanRules.PACMAN_SPEED
+GHOST_SPEED = GhostRules.GHOST_SPEED
+
+
+class PlayoutRules():
+	"""
+	The static information of a layout needed by the playouts: walls, cell numbers
+	and the legal moves of Pacman and the ghosts from every open cell. Kept with
+	the layout (layout.getAnalysis(PlayoutRules)).
+	"""
+
+	def __init__(self, layout):
+		self.layout = layout
+		self.walls = layout.walls
+		self.width = self.walls.width
+		self.height = self.walls.height
+		# Legal actions, from the move tables of the layout
+		tables = layout.moveTables
+		self.pacman_actions = tables.pacmanActions
+		self.ghost_actions = tables.ghostActions
+
+	def cell(self, pos):
+		return pos[0] * self.height + pos[1]
+
+
+class PlayoutAgentState():
+	"""
+	Position, direction and scared timer of one agent. It doubles as its own
+	configuration, so state.getGhostState(i).configuration.direction works as it
+	does on a GameState.
+	"""
+
+	__slots__ = ('pos', 'direction', 'scaredTimer', 'start', 'isPacman')
+
+	def __init__(self, pos, direction, scaredTimer, start, isPacman):
+		self.pos = pos
+		self.direction = direction
+		self.scaredTimer = scaredTimer
+		self.start = start
+		self.isPacman = isPacman
+
+	def copy(self):
+		return PlayoutAgentState(self.pos, self.direction, self.scaredTimer, self.start, self.isPacman)
+
+	@property
+	def configuration(self):
+		return self
+
+	def getPosition(self):
+		return self.pos
+
+	def getDirection(self):
+		return self.direction
+
+
+class PlayoutState():
+	"""
+	A mutable game state for playouts. It is created from a GameState and then
+	copied for each playout; generateSuccessor updates it in place unless asked
+	for a copy.
+	"""
+
+	def __init__(self, gameState=None):
+		if gameState is None:
+			return
+		data = gameState.data
+		self.rules = data.layout.getAnalysis(PlayoutRules)
+		self.agents = [PlayoutAgentState(agent.configuration.pos, agent.configuration.direction, agent.scaredTimer,
+										 agent.start.pos, agent.isPacman)
+					   for agent in data.agentStates]
+		food = 0
+		for pos in data.food.asList():
+			food |= 1 << self.rules.cell(pos)
+		self.food = food
+		self.numFood = gameState.getNumFood()
+		self.capsules = tuple(data.capsules)
+		self._eaten = list(data._eaten)
+		self._win = data._win
+		self._lose = data._lose
+		self.score = data.score
+		self.scoreChange = 0
+		self._undoLog = []
+
+	def copy(self):
+		state = PlayoutState()
+		state.rules = self.rules
+		state.agents = [agent.copy() for agent in self.agents]
+		state.food = self.food
+		state.numFood = self.numFood
+		state.capsules = self.capsules
+		state._eaten = self._eaten[:]
+		state._win = self._win
+		state._lose = self._lose
+		state.score = self.score
+		state.scoreChange = 0
+		state._undoLog = []
+		return state
+
+	deepCopy = copy
+
+	@property
+	def data(self):
+		# Code written against GameState reads flags such as data._eaten
+		return self
+
+	# Accessors, matching GameState
+
+	def getLegalActions(self, agentIndex=0):
+		if self._win or self._lose:
+			return []
+		agent = self.agents[agentIndex]
+		x, y = agent.pos
+		if agentIndex == 0:
+			return list(self.rules.pacman_actions[x * self.rules.height + y])
+		x_int, y_int = int(x + 0.5), int(y + 0.5)
+		# In between grid points, ghosts must continue straight
+		if abs(x - x_int) + abs(y - y_int) > Actions.TOLERANCE:
+			return [agent.direction]
+		return list(self.rules.ghost_actions[(x_int * self.rules.height + y_int, agent.direction)])
+
+	def getLegalPacmanActions(self):
+		return self.getLegalActions(0)
+
+	def getPacmanState(self, copy=True):
+		if not copy:
+			return self.agents[0]
+		return self.agents[0].copy()
+
+	def getPacmanPosition(self):
+		return self.agents[0].pos
+
+	def getGhostStates(self):
+		return self.agents[1:]
+
+	def getGhostState(self, agentIndex):
+		if agentIndex == 0 or agentIndex >= len(self.agents):
+			raise Exception("Invalid index passed to getGhostState")
+		return self.agents[agentIndex]
+
+	def getGhostPosition(self, agentIndex):
+		if agentIndex == 0:
+			raise Exception("Pacman's index passed to getGhostPosition")
+		return self.agents[agentIndex].pos
+
+	def getGhostPositions(self):
+		return [agent.pos for agent in self.agents[1:]]
+
+	def getNumAgents(self):
+		return len(self.agents)
+
+	def getScore(self):
+		return float(self.score)
+
+	def getCapsules(self):
+		return self.capsules
+
+	def getNumFood(self):
+		return self.numFood
+
+	def hasFood(self, x, y):
+		return (self.food >> (x * self.rules.height + y)) & 1 == 1
+
+	def getWalls(self):
+		return self.rules.walls
+
+	def hasWall(self, x, y):
+		return self.rules.walls[x][y]
+
+	def isWin(self):
+		return self._win
+
+	def isLose(self):
+		return self._lose
+
+	# Rules, matching PacmanRules and GhostRules
+
+	def generateSuccessor(self, agentIndex, action, copy=True):
+		if self._win or self._lose:
+			raise Exception('Can\'t generate a successor of a terminal state.')
+
+		state = self.copy() if copy else self
+		state._lose = False
+		state._win = False
+		state.scoreChange = 0
+
+		if agentIndex == 0:
+			state._eaten = [False] * len(state.agents)
+			state.applyPacmanAction(action)
+			state.scoreChange -= TIME_PENALTY
+		else:
+			state.applyGhostAction(action, agentIndex)
+			ghost = state.agents[agentIndex]
+			timer = ghost.scaredTimer
+			if timer == 1:
+				x, y = ghost.pos
+				ghost.pos = (int(x + 0.5), int(y + 0.5))
+			ghost.scaredTimer = max(0, timer - 1)
+
+		state.checkDeath(agentIndex)
+		state.score += state.scoreChange
+		return state
+
+	def push_move(self, agentIndex, action):
+		"""
+		Applies an action in place and returns the undo record that pop_move uses
+		to take it back, as GameState.push_move does.
+		"""
+		record = ([(agent.pos, agent.direction, agent.scaredTimer) for agent in self.agents], self.food, self.numFood,
+				  self.capsules, self._eaten[:], self._win, self._lose, self.score, self.scoreChange)
+		self._undoLog.append(record)
+		try:
+			self.generateSuccessor(agentIndex, action, copy=False)
+		except:
+			self.pop_move()
+			raise
+		return record
+
+	def pop_move(self):
+		record = self._undoLog.pop()
+		(agents, self.food, self.numFood, self.capsules, self._eaten, self._win, self._lose, self.score, self.scoreChange) = record
+		for agent, (pos, direction, scaredTimer) in zip(self.agents, agents):
+			agent.pos = pos
+			agent.direction = direction
+			agent.scaredTimer = scaredTimer
+		return record
+
+	def rewind(self):
+		while len(self._undoLog) > 0:
+			self.pop_move()
+
+	def applyPacmanAction(self, action):
+		if action not in self.getLegalActions(0):
+			raise Exception("Illegal action " + str(action))
+		pacman = self.agents[0]
+		dx, dy = Actions._directions[action]
+		x, y = pacman.pos
+		pos = (x + dx * PACMAN_SPEED, y + dy * PACMAN_SPEED)
+		pacman.pos = pos
+		if action != Directions.STOP:
+			pacman.direction = action
+
+		# Eat, Pacman always stands on a grid point
+		bit = 1 << (pos[0] * self.rules.height + pos[1])
+		if self.food & bit:
+			self.scoreChange += 10
+			self.food ^= bit
+			self.numFood -= 1
+			if self.numFood == 0 and not self._lose:
+				self.scoreChange += 500
+				self._win = True
+		if pos in self.capsules:
+			self.capsules = tuple(capsule for capsule in self.capsules if capsule != pos)
+			for ghost in self.agents[1:]:
+				ghost.scaredTimer = SCARED_TIME
+
+	def applyGhostAction(self, action, ghostIndex):
+		if action not in self.getLegalActions(ghostIndex):
+			raise Exception("Illegal ghost action " + str(action))
+		ghost = self.agents[ghostIndex]
+		speed = GHOST_SPEED
+		if ghost.scaredTimer > 0:
+			speed /= 2.0
+		dx, dy = Actions._directions[action]
+		x, y = ghost.pos
+		ghost.pos = (x + dx * speed, y + dy * speed)
+		if action != Directions.STOP:
+			ghost.direction = action
+
+	def checkDeath(self, agentIndex):
+		px, py = self.agents[0].pos
+		indices = range(1, len(self.agents)) if agentIndex == 0 else (agentIndex,)
+		for index in indices:
+			ghost = self.agents[index]
+			gx, gy = ghost.pos
+			if abs(gx - px) + abs(gy - py) <= COLLISION_TOLERANCE:
+				if ghost.scaredTimer > 0:
+					self.scoreChange += 200
+					ghost.pos = ghost.start
+					ghost.direction = Directions.STOP
+					ghost.scaredTimer = 0
+					self._eaten[index] = True
+				elif not self._win:
+					self.scoreChange -= 500
+					self._lose = True
@@ -153,14 +153,25 @@ def runGamesFast(layout, pacman, ghosts, display, numGames, record, numTraining=
 
     return scores, wins, winRate, numMoves
 
+def agentLabel(pacman_type, agentOpts):
+    """
+    The name results are grouped by: the agent type, and for the MCTS runs that
+    search for a time per move instead of a number of simulations, the time.
+    """
+    if pacman_type == 'MCTSAgent' and 'time_limit' in agentOpts:
+        return pacman_type + ' (time_limit=' + agentOpts['time_limit'] + ')'
+    return pacman_type
+
 def simulateWithArgs(arguments):
     start_time = time.time()
     args = arguments.split()
     options, agentOps, args = readCommandExtended(args)  # Get game components based on input
-    pacman_type = options.pacman
+    pacman_type = agentLabel(options.pacman, agentOps)
     ghost_type = options.ghost
     layout = options.layout
     scores, wins, winRate, numMoves = runGamesFast(**args)
+    # Nodes expanded per move, by the agents that count them
+    expansions_per_move = args['pacman'].expansionsPerMove() if hasattr(args['pacman'], 'expansionsPerMove') else 'N/A'
     average_score = sum(scores) / len(scores)
     # Convert array of booleans to array of strings with Win for True and Loss for False
     wins = ['Win' if win else 'Loss' for win in wins]
@@ -170,6 +181,7 @@ def simulateWithArgs(arguments):
     num_simulations = agentOps['num_simulations'] if 'num_simulations' in agentOps else 'N/A'
     simulation_length = agentOps['simulation_length'] if 'simulation_length' in agentOps else 'N/A'
     depth = agentOps['depth'] if 'depth' in agentOps else 'N/A'
+    time_limit = agentOps['time_limit'] if 'time_limit' in agentOps else 'N/A'
     num_ghosts = options.numGhosts
     tree_reuse = agentOps['tree_reuse'] if 'tree_reuse' in agentOps else 'N/A'
     command = 'python pacman.py ' + arguments
@@ -188,20 +200,27 @@ def simulateWithArgs(arguments):
         tree_reuse, 
         command,
         sum(numMoves) / len(numMoves),
-        time.time() - start_time
+        time.time() - start_time,
+        # Columns added since the first results, after the others so older result files still line up
+        time_limit,
+        expansions_per_move
     ]
 
 def createArgumentsList():
     directories = ['layouts/gen_small', 'layouts/gen_medium', 'layouts/gen_large']
-    pacman_types = ['MinimaxAgent', 'ExpectimaxAgent', 'MCTSAgent']
+    pacman_types = ['MinimaxAgent', 'ExpectimaxAgent', 'MacroMinimaxAgent', 'MacroExpectimaxAgent', 'AlphaBetaAgent', 'MCTSAgent']
     ghost_types = ['RandomGhost', 'DirectionalGhost']
     num_ghosts = [2, 4]
     # Only applicable to MCTSAgent
     #simulation_lengths = [10, 20, 30]
     simulation_lengths = [20]
-    # Only applicable to MinimaxAgent and ExpectimaxAgent
+    # Only applicable to MinimaxAgent and ExpectimaxAgent, and their macro
+    # versions, whose depth counts moves between junctions
     #depths = [3, 4, 5]
     depths = [2]
+    # Only applicable to AlphaBetaAgent, which searches as deep as it can in the time
+    # per move. It plays against MCTSAgent with the same time.
+    time_limits = [0.5]
     
     arguments_list = []
 
@@ -216,11 +235,18 @@ def createArgumentsList():
                             for simulation_length in simulation_lengths:
                                 arguments = '-q -n 2 --maxMoves 1500 --layout ' + directory + '/' + layout + ' --pacman ' + pacman_type + ' --ghost ' + ghost_type + ' --numghosts ' + str(num_ghost) + ' --agentArgs simulation_length=' + str(simulation_length) + ',should_reuse=True,ghost_type=' + ghost_type
                                 arguments_list.append(arguments)
-                        # Only applicable to MinimaxAgent and ExpectimaxAgent
-                        elif pacman_type == 'MinimaxAgent' or pacman_type == 'ExpectimaxAgent':
+                                # With the time of AlphaBetaAgent
+                                for time_limit in time_limits:
+                                    arguments_list.append(arguments + ',time_limit=' + str(time_limit))
+                        # Only applicable to MinimaxAgent and ExpectimaxAgent, and their macro versions
+                        elif pacman_type in ['MinimaxAgent', 'ExpectimaxAgent', 'MacroMinimaxAgent', 'MacroExpectimaxAgent']:
                             for depth in depths:
                                 arguments = '-q -n 1 --maxMoves 1500 --layout ' + directory + '/' + layout + ' --pacman ' + pacman_type + ' --ghost ' + ghost_type + ' --numghosts ' + str(num_ghost) + ' --agentArgs depth=' + str(depth)
                                 arguments_list.append(arguments)
+                        elif pacman_type == 'AlphaBetaAgent':
+                            for time_limit in time_limits:
+                                arguments = '-q -n 1 --maxMoves 1500 --layout ' + directory + '/' + layout + ' --pacman ' + pacman_type + ' --ghost ' + ghost_type + ' --numghosts ' + str(num_ghost) + ' --agentArgs time_limit=' + str(time_limit)
+                                arguments_list.append(arguments)
                         else:
                             arguments = '-q -n 1 --maxMoves 1500 --layout ' + directory + '/' + layout + ' --pacman ' + pacman_type + ' --ghost ' + ghost_type + ' --numghosts ' + str(num_ghost)
                             arguments_list.append(arguments)
@@ -236,11 +262,13 @@ def star_helper(func, args):
 
 def main():
     arguments_list = createArgumentsList()
-    num_per_agent = {
-        'MinimaxAgent': len(arguments_list) / 3,
-        'ExpectimaxAgent': len(arguments_list) / 3,
-        'MCTSAgent': len(arguments_list) / 3,
-    }
+    # Number of simulations of each agent type
+    num_per_agent = {}
+    for arguments in arguments_list:
+        agent_type = arguments.split(' --pacman ')[1].split()[0]
+        agentOpts = parseAgentArgs(arguments.split(' --agentArgs ')[1].split()[0]) if ' --agentArgs ' in arguments else {}
+        agent_type = agentLabel(agent_type, agentOpts)
+        num_per_agent[agent_type] = num_per_agent.get(agent_type, 0) + 1
     # Randomly shuffle the arguments list so that partial results are not biased towards the beginning of the list
     random.shuffle(arguments_list)
     print(f"Running {len(arguments_list)} simulations")
@@ -252,7 +280,7 @@ def main():
     num_completed = {}
     with open('results.csv', 'w', newline='') as file:
         writer = csv.writer(file, delimiter='|')
-        writer.writerow([
+        header = [
             'Pacman Agent',
             'Ghost Agent',
             'Layout',
@@ -267,8 +295,11 @@ def main():
             'Tree Reuse',
             'Command',
             'Average Number of Moves',
-            'Time Taken'
-        ])
+            'Time Taken',
+            'Time Limit',
+            'Expansions per Move'
+        ]
+        writer.writerow(header)
         file.flush()
         with mp.Pool(num_processes) as pool:
             #pool.imap_unordered(worker, arguments_list, chunksize=4)
@@ -276,7 +307,7 @@ def main():
                 writer.writerow(item)
                 file.flush()
                 elapsed_time = time.time() - start_time
-                simulation_time = item[-1]
+                simulation_time = item[header.index('Time Taken')]
 
                 # Calculate a smart estimate of the time remaining
                 # Each agent type has a different average time to run
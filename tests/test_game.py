@@ -0,0 +1,156 @@
+"""
+The fast paths of game.py checked against the code they replaced: BitGrid
+against the list backed Grid for the food, through the same random sequences
+of reads, writes and copies, and the MoveTables of a layout against
+Actions.getPossibleActions for every open cell and direction.
+
+Run with python -m unittest discover tests (or pytest) from the repository root.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+from game import Grid, BitGrid, MoveTables, Actions, Configuration, Directions
+
+MOVE_LAYOUTS = ['mediumClassic', 'originalClassic', 'trickyClassic', 'layouts/gen_small/small0_spatial.lay',
+				'layouts/gen_large/large0_spatial.lay']
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+
+SIZES = [(1, 1), (3, 5), (20, 7), (28, 31)]
+SEEDS = range(5)
+STEPS = 400
+
+
+class BitGridTest(unittest.TestCase):
+
+	def assertSameGrid(self, bitGrid, grid):
+		self.assertEqual((bitGrid.width, bitGrid.height), (grid.width, grid.height))
+		for x in range(grid.width):
+			for y in range(grid.height):
+				self.assertEqual(bitGrid[x][y], grid[x][y])
+		self.assertEqual(bitGrid.count(), grid.count())
+		self.assertEqual(bitGrid.count(False), grid.count(False))
+		self.assertEqual(bitGrid.asList(), grid.asList())
+		self.assertEqual(bitGrid.asList(False), grid.asList(False))
+		self.assertEqual(str(bitGrid), str(grid))
+		self.assertEqual(hash(bitGrid), hash(grid))
+		self.assertEqual(bitGrid, grid)
+
+	def test_initial_values(self):
+		for width, height in SIZES:
+			for value in [False, True]:
+				with self.subTest(size=(width, height), value=value):
+					self.assertSameGrid(BitGrid(width, height, value), Grid(width, height, value))
+
+	def test_random_writes_and_copies(self):
+		for width, height in SIZES:
+			for seed in SEEDS:
+				with self.subTest(size=(width, height), seed=seed):
+					random.seed(seed)
+					bitGrid = BitGrid(width, height)
+					grid = Grid(width, height)
+					copies = []
+					for step in range(STEPS):
+						x = random.randrange(width)
+						y = random.randrange(height)
+						value = random.random() < 0.6
+						if random.random() < 0.5:
+							bitGrid[x][y] = value
+						elif value:
+							bitGrid.set(x, y)
+						else:
+							bitGrid.clear(x, y)
+						grid[x][y] = value
+						self.assertEqual(bitGrid.test(x, y), value)
+						if random.random() < 0.1:
+							copies.append((bitGrid.copy(), grid.copy()))
+					self.assertSameGrid(bitGrid, grid)
+					# Writes to a grid never show in its copies
+					for bitCopy, copy in copies:
+						self.assertSameGrid(bitCopy, copy)
+						self.assertEqual(bitCopy == bitGrid, copy.data == grid.data)
+
+	def test_equality_and_hash(self):
+		a = BitGrid(4, 3)
+		b = BitGrid(4, 3)
+		a[1][2] = True
+		self.assertNotEqual(a, b)
+		b.set(1, 2)
+		self.assertEqual(a, b)
+		self.assertEqual(hash(a), hash(b))
+		# Grids of another shape differ even with the same cells set
+		self.assertNotEqual(BitGrid(3, 4), BitGrid(4, 3))
+		self.assertNotEqual(a, None)
+
+	def test_negative_and_out_of_range_indices(self):
+		bitGrid = BitGrid(4, 3)
+		bitGrid[-1][-1] = True
+		self.assertTrue(bitGrid[3][2])
+		self.assertEqual(len(bitGrid[0]), 3)
+		with self.assertRaises(IndexError):
+			bitGrid[4]
+		with self.assertRaises(IndexError):
+			bitGrid[0][3]
+		with self.assertRaises(IndexError):
+			bitGrid[0][3] = True
+
+	def test_layout_food(self):
+		for name in ['mediumClassic', 'originalClassic', 'testClassic']:
+			with self.subTest(layout=name):
+				food = layout.getLayout(name).food
+				self.assertSameGrid(BitGrid.fromGrid(food), food)
+
+
+def ghostActions(config, walls):
+	# GhostRules.getLegalActions before the move tables: ghosts can neither
+	# stop nor turn around, unless in a dead end
+	possibleActions = Actions.getPossibleActions(config, walls)
+	reverse = Actions.reverseDirection(config.direction)
+	if Directions.STOP in possibleActions:
+		possibleActions.remove(Directions.STOP)
+	if reverse in possibleActions and len(possibleActions) > 1:
+		possibleActions.remove(reverse)
+	return possibleActions
+
+
+class MoveTablesTest(unittest.TestCase):
+
+	def configurations(self, walls):
+		# Every open cell and direction, on the cell and half way to the next
+		# cell, where scared ghosts can be
+		for x in range(walls.width):
+			for y in range(walls.height):
+				if walls[x][y]:
+					continue
+				for direction in DIRECTIONS:
+					yield Configuration((x, y), direction)
+					yield Configuration((float(x), float(y)), direction)
+					dx, dy = Actions.directionToVector(direction, 0.5)
+					if not walls[int(x + 2 * dx)][int(y + 2 * dy)]:
+						yield Configuration((x + dx, y + dy), direction)
+
+	def test_moves_match_possible_actions(self):
+		for name in MOVE_LAYOUTS:
+			with self.subTest(layout=name):
+				walls = layout.getLayout(name).walls
+				tables = MoveTables(walls)
+				configs = 0
+				for config in self.configurations(walls):
+					self.assertEqual(list(tables.getPacmanActions(config)), Actions.getPossibleActions(config, walls), config)
+					self.assertEqual(list(tables.getGhostActions(config)), ghostActions(config, walls), config)
+					configs += 1
+				self.assertGreater(configs, 0)
+
+	def test_layout_builds_its_tables(self):
+		lay = layout.getLayout('mediumClassic')
+		self.assertIsInstance(lay.moveTables, MoveTables)
+		self.assertEqual(lay.moveTables.pacmanActions, MoveTables(lay.walls).pacmanActions)
+
+
+if __name__ == '__main__':
+	unittest.main()
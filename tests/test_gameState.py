@@ -0,0 +1,205 @@
+"""
+Invariants of GameStateData kept up to date move by move: the remaining food
+counter must match the food grid after every kind of move, copying, in place,
+and pushed and popped with the undo log, a food grid shared between states
+is copied before any of them eats from it, and the Zobrist hash updated by
+the rules matches the hash computed from scratch.
+
+Run with python -m unittest discover tests (or pytest) from the repository root.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+import pacman
+from game import Actions
+from mazeDistances import MazeDistances
+
+LAYOUTS = ['mediumClassic', 'originalClassic', 'smallClassic', 'testClassic']
+SEEDS = range(10)
+MAX_MOVES = 600
+
+
+class NumFoodTest(unittest.TestCase):
+
+	def assertFoodCounted(self, state):
+		self.assertEqual(state.data.numFood, state.data.food.count())
+		self.assertEqual(state.getNumFood(), len(state.data.food.asList()))
+
+	def test_counter_matches_food(self):
+		for name in LAYOUTS:
+			lay = layout.getLayout(name)
+			for seed in SEEDS:
+				with self.subTest(layout=name, seed=seed):
+					random.seed(seed)
+					state = pacman.GameState()
+					state.initialize(lay, lay.getNumGhosts())
+					self.assertFoodCounted(state)
+					pushed = []
+					for step in range(MAX_MOVES):
+						if state.isWin() or state.isLose():
+							break
+						index = step % state.getNumAgents()
+						action = random.choice(state.getLegalActions(index))
+						kind = random.random()
+						if kind < 0.4:
+							state = state.generateSuccessor(index, action)
+							pushed = []
+						elif kind < 0.6:
+							state = state.deepCopy()
+							state.generateSuccessor(index, action, copy=False)
+							pushed = []
+						elif kind < 0.8:
+							pushed.append(state.getNumFood())
+							state.push_move(index, action)
+						else:
+							state.generateSuccessor(index, action, copy=False)
+							pushed = []
+						self.assertFoodCounted(state)
+					# Taking the pushed moves back restores the count before each of them
+					while pushed and len(state.data._undoLog) > 0:
+						state.pop_move()
+						self.assertFoodCounted(state)
+						self.assertEqual(state.getNumFood(), pushed.pop())
+
+
+
+def eatingAction(state):
+	# A legal move of Pacman onto food
+	for action in state.getLegalActions(0):
+		x, y = Actions.getSuccessor(state.getPacmanPosition(), action)
+		if state.hasFood(int(x), int(y)):
+			return action
+	return None
+
+
+class FoodSharingTest(unittest.TestCase):
+
+	def setUp(self):
+		self.state = pacman.GameState()
+		self.state.initialize(layout.getLayout('mediumClassic'), 2)
+
+	def test_unshared_food_is_eaten_in_place(self):
+		state = self.state
+		food = state.data.food
+		numFood = state.getNumFood()
+		state.generateSuccessor(0, eatingAction(state), copy=False)
+		self.assertIs(state.data.food, food)
+		self.assertEqual(state.getNumFood(), numFood - 1)
+		self.assertEqual(state.getNumFood(), food.count())
+
+	def test_successor_copies_the_food_it_eats(self):
+		parent = self.state
+		food = parent.data.food.copy()
+		numFood = parent.getNumFood()
+		successor = parent.generateSuccessor(0, eatingAction(parent))
+		self.assertIsNot(successor.data.food, parent.data.food)
+		self.assertEqual(successor.getNumFood(), numFood - 1)
+		self.assertEqual(successor.getNumFood(), successor.data.food.count())
+		self.assertEqual(parent.data.food, food)
+		self.assertEqual(parent.getNumFood(), parent.data.food.count())
+		# The parent gave up its grid, so eating from it now copies too
+		parent.generateSuccessor(0, eatingAction(parent), copy=False)
+		self.assertEqual(successor.data.food.count(), numFood - 1)
+		self.assertEqual(parent.getNumFood(), parent.data.food.count())
+
+	def test_successors_never_change_their_parent(self):
+		for seed in SEEDS:
+			with self.subTest(seed=seed):
+				random.seed(seed)
+				state = self.state.deepCopy()
+				for step in range(MAX_MOVES):
+					if state.isWin() or state.isLose():
+						break
+					index = step % state.getNumAgents()
+					food = state.data.food.copy()
+					numFood = state.getNumFood()
+					successors = [state.generateSuccessor(index, action) for action in state.getLegalActions(index)]
+					for successor in successors:
+						if not (successor.isWin() or successor.isLose()):
+							successor.generateSuccessor(0, random.choice(successor.getLegalActions(0)), copy=False)
+						self.assertEqual(successor.getNumFood(), successor.data.food.count())
+					self.assertEqual(state.data.food, food)
+					self.assertEqual(state.getNumFood(), numFood)
+					state = random.choice(successors)
+
+	def test_pop_does_not_give_back_shared_food(self):
+		# A successor made from a pushed state shares the food restored by the pop
+		state = self.state
+		state.push_move(0, 'Stop')
+		successor = state.generateSuccessor(1, state.getLegalActions(1)[0])
+		state.pop_move()
+		self.assertIs(state.data.food, successor.data.food)
+		food = successor.data.food.copy()
+		state.generateSuccessor(0, eatingAction(state), copy=False)
+		self.assertEqual(successor.data.food, food)
+		self.assertEqual(successor.getNumFood(), successor.data.food.count())
+		self.assertEqual(state.getNumFood(), state.data.food.count())
+
+
+
+def huntingAction(state):
+	# Mostly the move towards the nearest capsule or scared ghost, so that
+	# both get eaten often
+	actions = state.getLegalActions(0)
+	targets = state.getCapsules() + [ghost.getPosition() for ghost in state.getGhostStates() if ghost.scaredTimer > 0]
+	if not targets or random.random() < 0.3:
+		return random.choice(actions)
+	distances = state.data.layout.getAnalysis(MazeDistances)
+	x, y = state.getPacmanPosition()
+	def distance(action):
+		dx, dy = Actions.directionToVector(action)
+		return min(distances.distance((int(x + dx), int(y + dy)), (int(tx), int(ty))) for (tx, ty) in targets)
+	return min(actions, key=distance)
+
+
+class HashTest(unittest.TestCase):
+
+	def assertHashed(self, state):
+		self.assertEqual(state.data._hash, state.data.computeHash())
+
+	def test_hash_matches_computed_hash(self):
+		capsules = ghosts = 0
+		for name in ['mediumClassic', 'originalClassic', 'smallClassic']:
+			lay = layout.getLayout(name)
+			for seed in SEEDS:
+				with self.subTest(layout=name, seed=seed):
+					random.seed(seed)
+					state = pacman.GameState()
+					state.initialize(lay, lay.getNumGhosts())
+					self.assertHashed(state)
+					pushed = 0
+					for step in range(MAX_MOVES):
+						if state.isWin() or state.isLose():
+							break
+						index = step % state.getNumAgents()
+						action = huntingAction(state) if index == 0 else random.choice(state.getLegalActions(index))
+						kind = random.random()
+						if kind < 0.4:
+							state = state.generateSuccessor(index, action)
+							pushed = 0
+						elif kind < 0.7:
+							state.push_move(index, action)
+							pushed += 1
+						else:
+							state.generateSuccessor(index, action, copy=False)
+							pushed = 0
+						self.assertHashed(state)
+						capsules += state.data._capsuleEaten is not None
+						ghosts += any(state.data._eaten)
+					while pushed > 0:
+						state.pop_move()
+						pushed -= 1
+						self.assertHashed(state)
+		# The moves covered eating capsules and scared ghosts
+		self.assertGreater(capsules, 0)
+		self.assertGreater(ghosts, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,157 @@
+"""
+The search agents of tommy_multiAgents.py on seeded mid-game states: pruning,
+move ordering and the transposition table must not change their decisions.
+Pruned expectimax plays the actions of the plain one, alpha-beta, ordered or
+not, plays actions of the minimax value, and the agents play the same actions
+with the table on and off. The table itself replaces the least recently used
+entry when full, and stores nothing with size 0.
+
+Run with python -m unittest discover tests (or pytest) from the repository root.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+import pacman
+import tommy_multiAgents
+
+# Layouts and the depths searched on them
+LAYOUTS = [('smallClassic', 3), ('testClassic', 3), ('mediumClassic', 2), ('layouts/gen_medium/medium1_spatial.lay', 2)]
+SEEDS = range(3)
+STATES_PER_GAME = 3
+
+
+def midGameStates():
+	# (layout, depth, state) of states along seeded random games
+	states = []
+	for name, depth in LAYOUTS:
+		lay = layout.getLayout(name)
+		for seed in SEEDS:
+			random.seed(seed)
+			state = pacman.GameState()
+			state.initialize(lay, lay.getNumGhosts())
+			found = 0
+			while found < STATES_PER_GAME and not (state.isWin() or state.isLose()):
+				for index in range(state.getNumAgents()):
+					if state.isWin() or state.isLose():
+						break
+					state = state.generateSuccessor(index, random.choice(state.getLegalActions(index)))
+				if not (state.isWin() or state.isLose()) and random.random() < 0.5:
+					states.append((name, depth, state))
+					found += 1
+	return states
+
+
+def agent(cls, state, **args):
+	agent = cls(**{key: str(value) for key, value in args.items()})
+	agent.registerInitialState(state)
+	return agent
+
+
+class SearchDecisionTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.states = midGameStates()
+
+	def test_pruned_expectimax_plays_the_unpruned_actions(self):
+		for number, (name, depth, state) in enumerate(self.states):
+			with self.subTest(layout=name, state=number):
+				plain = agent(tommy_multiAgents.ExpectimaxAgent, state, depth=depth, prune=0, tt_size=0)
+				pruned = agent(tommy_multiAgents.ExpectimaxAgent, state, depth=depth)
+				self.assertEqual(pruned.getAction(state), plain.getAction(state))
+				self.assertIsNotNone(pruned.boundsFunction)
+
+	def test_alphabeta_plays_the_minimax_actions(self):
+		for number, (name, depth, state) in enumerate(self.states):
+			with self.subTest(layout=name, state=number):
+				minimax = agent(tommy_multiAgents.MinimaxAgent, state, depth=depth, tt_size=0)
+				alphabeta = agent(tommy_multiAgents.AlphaBetaAgent, state, depth=depth)
+				self.assertEqual(alphabeta.getAction(state), minimax.getAction(state))
+
+	def test_ordered_alphabeta_plays_actions_of_the_minimax_value(self):
+		# Ordered searches break score ties differently, so they are only
+		# bound to pick an action of the same value
+		for number, (name, depth, state) in enumerate(self.states):
+			with self.subTest(layout=name, state=number):
+				minimax = agent(tommy_multiAgents.MinimaxAgent, state, depth=depth, tt_size=0)
+				alphabeta = agent(tommy_multiAgents.AlphaBetaAgent, state, depth=depth)
+				# Deepening as the anytime mode does, without the deadline
+				for searched in range(1, depth + 1):
+					(action, complete) = alphabeta.search(state, searched, ordered=True)
+					if complete:
+						break
+				value = lambda action: minimax.minimax(state.generateSuccessor(0, action), depth, 1)[1]
+				self.assertEqual(value(action), value(minimax.getAction(state)))
+
+
+	def test_table_keeps_the_decisions(self):
+		# One agent with a table per layout, kept across the states as it is
+		# kept across the moves of a game
+		tables = {}
+		for number, (name, depth, state) in enumerate(self.states):
+			with self.subTest(layout=name, state=number):
+				if name not in tables:
+					tables[name] = (agent(tommy_multiAgents.MinimaxAgent, state, depth=depth),
+									agent(tommy_multiAgents.ExpectimaxAgent, state, depth=depth, prune=0))
+				(minimax, expectimax) = tables[name]
+				self.assertEqual(minimax.getAction(state),
+								 agent(tommy_multiAgents.MinimaxAgent, state, depth=depth, tt_size=0).getAction(state))
+				self.assertEqual(expectimax.getAction(state),
+								 agent(tommy_multiAgents.ExpectimaxAgent, state, depth=depth, prune=0, tt_size=0).getAction(state))
+		for (minimax, expectimax) in tables.values():
+			self.assertGreater(minimax.table.hits, 0)
+			self.assertGreater(expectimax.table.hits, 0)
+
+
+class TranspositionTableTest(unittest.TestCase):
+
+	def test_least_recently_used_entry_is_evicted(self):
+		table = tommy_multiAgents.TranspositionTable(2)
+		table.store('a', 'North', 1)
+		table.store('b', 'South', 2)
+		self.assertEqual(table.probe('a'), ('North', 1))
+		table.store('c', 'East', 3)
+		self.assertEqual(list(table.entries), ['a', 'c'])
+		self.assertIsNone(table.probe('b'))
+		self.assertEqual(table.evictions, 1)
+		# Storing again refreshes an entry without evicting another
+		table.store('a', 'West', 4)
+		table.store('d', 'Stop', 5)
+		self.assertEqual(list(table.entries), ['a', 'd'])
+		self.assertEqual(table.probe('a'), ('West', 4))
+		self.assertEqual(table.evictions, 2)
+
+	def test_bounds_only_settle_searches_outside_of_the_window(self):
+		table = tommy_multiAgents.TranspositionTable(4)
+		table.store('lower', 'North', 5, tommy_multiAgents.LOWER)
+		table.store('upper', 'South', 5, tommy_multiAgents.UPPER)
+		self.assertEqual(table.probe('lower', 0, 4), ('North', 5))
+		self.assertIsNone(table.probe('lower', 0, 6))
+		self.assertIsNone(table.probe('lower', 0, 5))
+		self.assertEqual(table.probe('lower', 0, 5, ties=True), ('North', 5))
+		self.assertEqual(table.probe('upper', 6, 10), ('South', 5))
+		self.assertIsNone(table.probe('upper', 4, 10))
+		self.assertEqual(table.probe('upper', 5, 10, ties=True), ('South', 5))
+
+	def test_size_zero_stores_nothing(self):
+		table = tommy_multiAgents.TranspositionTable(0)
+		table.store('a', 'North', 1)
+		self.assertEqual(len(table.entries), 0)
+		self.assertIsNone(table.probe('a'))
+		state = pacman.GameState()
+		state.initialize(layout.getLayout('smallClassic'), 2)
+		for cls in [tommy_multiAgents.MinimaxAgent, tommy_multiAgents.AlphaBetaAgent, tommy_multiAgents.ExpectimaxAgent]:
+			searcher = agent(cls, state, depth=2, tt_size=0)
+			searcher.getAction(state)
+			self.assertEqual(len(searcher.table.entries), 0)
+			self.assertEqual(searcher.table.hits, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
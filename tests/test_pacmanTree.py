@@ -0,0 +1,167 @@
+"""
+Re-rooting PacmanTree in place, checked against the copy-based re-rooting it
+replaced: seeded searches on a layout with a one-cell dead end next to a
+junction, after which Pacman steps into the dead end.
+
+Run with python -m unittest discover tests (or pytest) from the repository root.
+"""
+
+import copy
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+import pacman
+import mctsAgents
+import PacmanTree
+from game import Directions
+
+# Pacman starts on a junction, with a one-cell dead end to the south
+LAYOUT = ['%%%%%%%',
+          '%..P..%',
+          '%.%.%.%',
+          '%..%.G%',
+          '%%%%%%%']
+
+DISCOUNT = 0.6
+
+
+def reroot_by_copy(tree, new_state, discount):
+	# PacmanTree.update before re-rooting in place, when leaving a junction for
+	# the position of one of the root's children
+	new_pos = new_state.getPacmanPosition()
+	action = new_state.getPacmanState().getDirection()
+	child_positions = [child.position for child in tree.root.children]
+	new_root = [child for child in tree.root.children if child.actions[0] == action and child.position == new_pos][0]
+
+	old_root = tree.root.copy()
+	tree.root = new_root
+	tree.root.parent = None
+
+	# Remove new root from old root's children
+	if new_root in old_root.children:
+		old_root.removeChild(new_root)
+
+	for (pos, actions) in tree.successors(new_root.position):
+		if pos == old_root.position:
+			old_root.actions = actions
+			new_root.addChild(old_root)
+		if pos in child_positions:
+			new_child = old_root.children[child_positions.index(pos)].copy()
+			new_child.actions = actions
+			new_root.addChild(new_child)
+	tree.pool.apply_discount(discount)
+	return old_root
+
+
+def clone(tree):
+	# A tree with its own copy of the nodes, sharing the tables of the layout
+	cloned = copy.copy(tree)
+	cloned.pool = copy.deepcopy(tree.pool)
+	cloned.root = cloned.pool.node(tree.root.index)
+	return cloned
+
+
+def statistics(pool, index):
+	# The (visits, survival, pill, ghost) totals of a node, undoing the scale
+	scale = pool.scale
+	return (pool.visits[index] * scale, pool.survival[index] * scale, pool.pill[index] * scale, pool.ghost_sum(index) * scale)
+
+
+def dump(node):
+	# The statistics of a subtree, by position and edge actions
+	pool = node.pool
+	return ((node.position, tuple(node.actions or ()), statistics(pool, node.index), pool.best_means(node.index)),
+			sorted(dump(child) for child in node.children))
+
+
+def expected_best_means(node):
+	# The best child means of a node, recomputed from its children
+	pool = node.pool
+	means = [pool.mean_rewards(child.index) for child in node.children if pool.visits[child.index] > 0]
+	if not means:
+		return pool.best_means(node.index)
+	return tuple(max(mean[tactic] for mean in means) for tactic in (mctsAgents.Tactic.SURVIVAL, mctsAgents.Tactic.PILL, mctsAgents.Tactic.GHOST))
+
+
+class RerootTest(unittest.TestCase):
+
+	def test_relinked_tree_keeps_the_copied_statistics(self):
+		lay = layout.Layout(LAYOUT)
+		moved_best = 0
+		for seed in range(20):
+			random.seed(seed)
+			state = pacman.GameState()
+			state.initialize(lay, 1)
+			agent = mctsAgents.MCTSAgent(num_simulations='60')
+			agent.tree = PacmanTree.PacmanTree(state)
+			agent.num_pills = state.getNumFood()
+			agent.runMCTS(state)
+			new_state = state.generateSuccessor(0, Directions.SOUTH)
+
+			copied = clone(agent.tree)
+			copied_old_root = reroot_by_copy(copied, new_state, DISCOUNT)
+			relinked = clone(agent.tree)
+			pool_size = len(relinked.pool)
+			old_root = relinked.root
+			relinked.update(new_state, DISCOUNT)
+
+			# Same new root, with the same statistics
+			self.assertEqual(dump(relinked.root)[0], dump(copied.root)[0])
+			self.assertEqual(relinked.root.position, new_state.getPacmanPosition())
+			# Nothing is copied
+			self.assertEqual(len(relinked.pool), pool_size)
+			self.assertGreater(len(copied.pool), pool_size)
+
+			# The siblings are moved below the new root rather than duplicated,
+			# and the new root is no longer below the old root
+			moved = set(child.position for child in relinked.root.children) | {relinked.root.position}
+			self.assertEqual(sorted(dump(child) for child in relinked.root.children if child != old_root),
+							 sorted(dump(child) for child in copied.root.children if child != copied_old_root))
+			self.assertEqual(dump(old_root)[1],
+							 sorted(dump(child) for child in copied_old_root.children if child.position not in moved))
+			self.assertIn(old_root, relinked.root.children)
+			self.assertIsNone(relinked.root.parent)
+			self.assertEqual(old_root.parent, relinked.root)
+
+			# The old root keeps its own statistics, and its cached best child
+			# means now only cover the children it kept
+			pool = relinked.pool
+			self.assertEqual(statistics(pool, old_root.index), statistics(copied.pool, copied_old_root.index))
+			for cached, expected in zip(pool.best_means(old_root.index), expected_best_means(old_root)):
+				self.assertAlmostEqual(cached, expected)
+			if pool.best_means(old_root.index) != copied.pool.best_means(copied_old_root.index):
+				moved_best += 1
+		# Some searches had their best child moved off the old root
+		self.assertGreater(moved_best, 0)
+
+
+class MergeTest(unittest.TestCase):
+
+	def test_merged_root_counts_every_search(self):
+		lay = layout.Layout(LAYOUT)
+		random.seed(0)
+		state = pacman.GameState()
+		state.initialize(lay, 1)
+		agent = mctsAgents.MCTSAgent(num_simulations='60')
+		agent.tree = PacmanTree.PacmanTree(state)
+		agent.num_pills = state.getNumFood()
+		(total, _) = agent.runMCTS(state)
+		for seed in range(3):
+			(simulations, _, merged) = mctsAgents.search_worker({'num_simulations': '60'}, state, state.getNumFood(), seed)
+			agent.tree.merge_statistics(merged)
+			total += simulations
+		# The root's visits are still those of its children, for the searches
+		# of the next moves, which reuse the merged tree
+		pool = agent.tree.pool
+		root = agent.tree.root.index
+		self.assertAlmostEqual(statistics(pool, root)[0], total)
+		self.assertAlmostEqual(sum(statistics(pool, child)[0] for child in pool.children(root)), total)
+
+
+if __name__ == '__main__':
+	unittest.main()
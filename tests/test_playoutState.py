@@ -0,0 +1,78 @@
+"""
+PlayoutState played step by step against GameState: with the same seeds, both
+must offer the same legal actions and end up with the same positions, timers,
+score and flags after every move, for random and directional ghosts.
+
+Run with python -m unittest discover tests (or pytest) from the repository root.
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layout
+import pacman
+from ghostAgents import RandomGhost, DirectionalGhost
+from playoutState import PlayoutState
+
+LAYOUTS = ['layouts/gen_small/small0_spatial.lay', 'layouts/gen_medium/medium3_spatial.lay', 'mediumClassic', 'originalClassic']
+SEEDS = range(10)
+MAX_MOVES = 300
+
+
+class PlayoutStateTest(unittest.TestCase):
+
+	def assertSameState(self, state, playout):
+		self.assertEqual(state.getScore(), playout.getScore())
+		self.assertEqual(state.isWin(), playout.isWin())
+		self.assertEqual(state.isLose(), playout.isLose())
+		self.assertEqual(state.getNumFood(), playout.getNumFood())
+		self.assertEqual(list(state.getCapsules()), list(playout.getCapsules()))
+		self.assertEqual([agent.getPosition() for agent in state.data.agentStates], [agent.pos for agent in playout.agents])
+		self.assertEqual([agent.getDirection() for agent in state.data.agentStates], [agent.direction for agent in playout.agents])
+		self.assertEqual([agent.scaredTimer for agent in state.data.agentStates], [agent.scaredTimer for agent in playout.agents])
+		self.assertEqual(list(state.data._eaten), playout._eaten)
+
+	def play(self, lay, ghost_type, seed):
+		state = pacman.GameState()
+		state.initialize(lay, lay.getNumGhosts())
+		playout = PlayoutState(state)
+		ghosts = [ghost_type(index) for index in range(1, state.getNumAgents())]
+		random.seed(seed)
+		for step in range(MAX_MOVES):
+			if state.isWin() or state.isLose():
+				break
+			index = step % state.getNumAgents()
+			legal = state.getLegalActions(index)
+			self.assertEqual(legal, list(playout.getLegalActions(index)))
+			# Both sides draw the same random numbers for their move
+			random_state = random.getstate()
+			action = random.choice(legal) if index == 0 else ghosts[index - 1].getAction(state)
+			random.setstate(random_state)
+			playout_action = random.choice(legal) if index == 0 else ghosts[index - 1].getAction(playout)
+			self.assertEqual(action, playout_action)
+			state = state.generateSuccessor(index, action)
+			# Half of the moves are made in place
+			playout = playout.generateSuccessor(index, playout_action, copy=(step % 2 == 0))
+			self.assertSameState(state, playout)
+
+	def test_random_ghosts(self):
+		for name in LAYOUTS:
+			lay = layout.getLayout(name)
+			for seed in SEEDS:
+				with self.subTest(layout=name, seed=seed):
+					self.play(lay, RandomGhost, seed)
+
+	def test_directional_ghosts(self):
+		for name in LAYOUTS:
+			lay = layout.getLayout(name)
+			for seed in SEEDS:
+				with self.subTest(layout=name, seed=seed):
+					self.play(lay, DirectionalGhost, seed)
+
+
+if __name__ == '__main__':
+	unittest.main()
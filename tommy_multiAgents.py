@@ -13,11 +13,17 @@
 
 
 import math
+import itertools
+import os
+from collections import OrderedDict
 from util import manhattanDistance
-from game import Directions
-import random, util
+from game import Directions, Actions
+import random, util, time
 
 from game import Agent
+from pacman import TIME_PENALTY
+from junctionGraph import JunctionGraph
+from workerPools import get_worker_pool, usable_workers
 
 class ReflexAgent(Agent):
     """
@@ -98,6 +104,128 @@ def scoreEvaluationFunction(currentGameState):
     """
     return currentGameState.getScore()
 
+def scoreEvaluationBounds(currentGameState, depth, agentIndex):
+    """
+    Lower and upper bounds on scoreEvaluationFunction over the states that
+    can be reached from currentGameState before the search stops, depth
+    rounds of moves ahead with agentIndex to move. Every Pacman move costs
+    the time penalty and eats at most one food, though games that end early
+    pay less of the penalty. The game can be won by eating all of the food,
+    or lost, only once. Each scared ghost close enough to be caught can be
+    eaten once, and every ghost once more for every capsule within reach.
+    """
+    score = currentGameState.getScore()
+    moves = depth if agentIndex == 0 else depth - 1
+    food = currentGameState.getNumFood()
+    ghosts = currentGameState.getNumAgents() - 1
+    position = currentGameState.getPacmanPosition()
+    capsules = len([capsule for capsule in currentGameState.getCapsules() if manhattanDistance(position, capsule) <= moves])
+    # Pacman and the ghosts both close in, up to the collision tolerance
+    scared = len([ghost for ghost in currentGameState.getGhostStates()
+                  if ghost.scaredTimer > 0 and manhattanDistance(position, ghost.getPosition()) <= moves + depth + 1])
+    eaten = scared + ghosts * min(capsules, moves)
+    lower = score - moves * TIME_PENALTY - 500
+    upper = score + 10 * min(moves, food) + 200 * eaten
+    if food <= moves:
+        upper += 500
+    return (lower, upper)
+
+# Bounds of the evaluation functions, for pruning chance nodes
+EVALUATION_BOUNDS = {scoreEvaluationFunction: scoreEvaluationBounds}
+
+# Kinds of values stored in a transposition table: exact values, and the lower
+# and upper bounds left by alpha-beta cutoffs
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """
+    A bounded table of search results, so positions reached again by another
+    order of moves are not searched again. Entries are keyed by the Zobrist
+    hash and the score of the state (see GameStateData.__hash__), the depth
+    left to search and the agent to move, and hold the best action, the value
+    and whether the value is exact or a bound. When the table is full, the
+    least recently used entry is replaced.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        # Counters, kept across clears
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, state, depth, agentIndex):
+        return (hash(state), state.getScore(), depth, agentIndex)
+
+    def probe(self, key, alpha=-math.inf, beta=math.inf, ties=False):
+        """
+        Returns the stored (action, value) if it settles the search of the
+        state with the window (alpha, beta), None otherwise. With ties, a
+        bound equal to alpha or beta settles it too, for searches that cut
+        off on ties.
+        """
+        self.probes += 1
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        action, value, bound = entry
+        if (bound == EXACT or (bound == LOWER and (value > beta or (ties and value == beta))) or
+                (bound == UPPER and (value < alpha or (ties and value == alpha)))):
+            self.hits += 1
+            return (action, value)
+        return None
+
+    def store(self, key, action, value, bound=EXACT):
+        if self.size <= 0:
+            return
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        elif len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.entries[key] = (action, value, bound)
+        self.stores += 1
+
+    def action(self, key):
+        """
+        Returns the best action stored for the key, whatever its bound, or None.
+        """
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def clear(self):
+        self.entries.clear()
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes > 0 else 0.0
+
+    def __str__(self):
+        return 'probes %d, hits %d (%.1f%%), stores %d, evictions %d' % (
+            self.probes, self.hits, 100 * self.hitRate(), self.stores, self.evictions)
+
+# Agents living in a worker process, one per agent type and arguments
+worker_agents = {}
+
+# Numbers the games of this process, for the tables of the worker agents
+game_numbers = itertools.count()
+
+def search_worker(agent_type, agent_args, game, state, depth, agentIndex):
+    """
+    Returns the value of the subtree below state inside a worker process. The
+    transposition table of the worker agent is kept across the moves of a game.
+    """
+    key = (agent_type, tuple(sorted(agent_args.items())))
+    if key not in worker_agents:
+        worker_agents[key] = globals()[agent_type](**agent_args)
+    agent = worker_agents[key]
+    if agent.game != game:
+        agent.table.clear()
+        agent.game = game
+    return agent.subtreeValue(state, depth, agentIndex)
+
 class MultiAgentSearchAgent(Agent):
     """
     This class provides some common elements to all of your
@@ -113,16 +241,97 @@ class MultiAgentSearchAgent(Agent):
     is another abstract class.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt_size = '65536'):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        # Searched positions, kept across moves (tt_size=0 turns it off)
+        self.table = TranspositionTable(int(tt_size))
+        self.workers = 1
+        self.split_ghosts = False
+        self.game = None
+
+    def registerInitialState(self, state):
+        # Values of another game may come from another layout
+        self.table.clear()
+        self.game = (os.getpid(), next(game_numbers))
+
+    def setWorkers(self, workers, split_ghosts, **agent_args):
+        """
+        Searches the subtrees below the root (and below the first ghost's moves
+        with split_ghosts) in a pool of worker processes, whose agents are made
+        from agent_args. The states are sent pickled, which is compact as
+        layouts pickle as references to the layouts of the worker.
+        """
+        self.workers = usable_workers(int(workers))
+        self.split_ghosts = bool(int(split_ghosts))
+        self.worker_args = agent_args
+
+    def subtreeValue(self, state, depth, agentIndex):
+        """
+        Returns the value of state searched with depth left and agentIndex to move.
+        """
+        util.raiseNotDefined()
+
+    def ghostValue(self, values):
+        """
+        Returns the value of a ghost's move from the values of its choices.
+        """
+        util.raiseNotDefined()
+
+    def splitRoot(self, gameState):
+        """
+        Returns the action of the search with the subtrees below the root
+        searched by the worker pool. Their values are combined as the search
+        would, so the actions are the same as with a single process.
+        """
+        num_agents = gameState.getNumAgents()
+        subtrees = []
+        # (action, index of its first subtree, number of subtrees split at the first ghost)
+        moves = []
+        for action in gameState.getLegalActions(0):
+            successor = gameState.generateSuccessor(0, action)
+            next_agent = 1 % num_agents
+            if self.split_ghosts and next_agent != 0 and not (successor.isWin() or successor.isLose()):
+                ghost_actions = successor.getLegalActions(1)
+                next_agent = 2 % num_agents
+                depth = self.depth - 1 if next_agent == 0 else self.depth
+                moves.append((action, len(subtrees), len(ghost_actions)))
+                subtrees.extend((successor.generateSuccessor(1, ghost_action), depth, next_agent) for ghost_action in ghost_actions)
+            else:
+                depth = self.depth - 1 if next_agent == 0 else self.depth
+                moves.append((action, len(subtrees), 0))
+                subtrees.append((successor, depth, next_agent))
+
+        pool = get_worker_pool(self.workers)
+        agent_type = type(self).__name__
+        values = pool.starmap(search_worker, [(agent_type, self.worker_args, self.game, state, depth, agentIndex)
+                                              for (state, depth, agentIndex) in subtrees])
+
+        best_action = None
+        best_score = -math.inf
+        for (action, start, num_ghost_actions) in moves:
+            if num_ghost_actions > 0:
+                score = self.ghostValue(values[start:start + num_ghost_actions])
+            else:
+                score = values[start]
+            if max(score, best_score) == score:
+                best_action = action
+                best_score = score
+        return best_action
 
 class MinimaxAgent(MultiAgentSearchAgent):
     """
     Your minimax agent (question 2)
+
+    With workers > 1, the subtrees below the root are searched in parallel
+    (see MultiAgentSearchAgent.setWorkers).
     """
 
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt_size = '65536', workers = '1', split_ghosts = '0'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, tt_size)
+        self.setWorkers(workers, split_ghosts, evalFn=evalFn, depth=depth, tt_size=tt_size)
+
     def getAction(self, gameState):
         """
         Returns the minimax action from the current gameState using self.depth
@@ -148,66 +357,237 @@ class MinimaxAgent(MultiAgentSearchAgent):
         """
         "*** YOUR CODE HERE ***"
 
-        def minimax(state, depth, agentIndex):
-            if state.isWin() or state.isLose() or depth == 0:
-                return (None, self.evaluationFunction(state))
-            next_agent = (agentIndex + 1) % state.getNumAgents()
-            if next_agent == 0:
-                depth -= 1
-            selector = max if agentIndex == 0 else min
-            best_action = None
-            best_score = -math.inf if agentIndex == 0 else math.inf
-            for action in state.getLegalActions(agentIndex):
-                (_, score) = minimax(state.generateSuccessor(agentIndex, action), depth, next_agent)
-                if selector(score, best_score) == score:
-                    best_action = action
-                    best_score = score
-            return (best_action, best_score)
-        
-        return minimax(gameState, self.depth, 0)[0]
+        if self.workers > 1:
+            return self.splitRoot(gameState)
+        return self.minimax(gameState, self.depth, 0, root=True)[0]
+
+    def minimax(self, state, depth, agentIndex, root=False):
+        if state.isWin() or state.isLose() or depth == 0:
+            return (None, self.evaluationFunction(state))
+        key = self.table.key(state, depth, agentIndex)
+        if not root:
+            entry = self.table.probe(key)
+            if entry is not None:
+                return entry
+        next_agent = (agentIndex + 1) % state.getNumAgents()
+        if next_agent == 0:
+            depth -= 1
+        selector = max if agentIndex == 0 else min
+        best_action = None
+        best_score = -math.inf if agentIndex == 0 else math.inf
+        for action in state.getLegalActions(agentIndex):
+            (_, score) = self.minimax(state.generateSuccessor(agentIndex, action), depth, next_agent)
+            if selector(score, best_score) == score:
+                best_action = action
+                best_score = score
+        self.table.store(key, best_action, best_score)
+        return (best_action, best_score)
+
+    def subtreeValue(self, state, depth, agentIndex):
+        return self.minimax(state, depth, agentIndex)[1]
+
+    def ghostValue(self, values):
+        return min(values)
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time is up.
+    """
+    pass
+
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
     Your minimax agent with alpha-beta pruning (question 3)
+
+    With a time_limit (in seconds per move) the agent searches anytime: it
+    deepens one round of moves at a time until the time is up, and plays the
+    best action of the deepest search that completed. Each search tries the
+    best actions of the previous ones first, as found in the transposition
+    table, and then the actions that caused the most cutoffs (the history
+    heuristic).
     """
 
+    # Deepest search of the anytime mode, in rounds of moves
+    MAX_DEPTH = 64
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt_size = '65536', time_limit = '0'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, tt_size)
+        self.time_limit = float(time_limit)
+        # Cutoffs caused by each action of each agent from each position,
+        # weighted by the depth left
+        self.history = {}
+        # Depth of the last completed search
+        self.completed_depth = 0
+
+    def registerInitialState(self, state):
+        MultiAgentSearchAgent.registerInitialState(self, state)
+        self.history = {}
+
     def getAction(self, gameState):
         """
         Returns the minimax action using self.depth and self.evaluationFunction
         """
         "*** YOUR CODE HERE ***"
 
-        def minimax(state, depth, agentIndex, alpha, beta):
-            if state.isWin() or state.isLose() or depth == 0:
+        if self.time_limit <= 0:
+            self.completed_depth = self.depth
+            return self.search(gameState, self.depth)[0]
+
+        deadline = time.time() + self.time_limit
+        # Old cutoffs count for less than new ones
+        for key in self.history:
+            self.history[key] //= 2
+        # The first search always completes, so there is an action to return
+        best_action, complete = self.search(gameState, 1, ordered=True)
+        self.completed_depth = 1
+        depth = 2
+        while not complete and depth <= self.MAX_DEPTH:
+            try:
+                best_action, complete = self.search(gameState, depth, deadline, ordered=True)
+            except SearchTimeout:
+                break
+            self.completed_depth = depth
+            depth += 1
+        return best_action
+
+    def orderActions(self, state, depth, agentIndex, actions):
+        """
+        Sorts the actions by the cutoffs they caused, after the best action
+        stored for the state by this search or else by the previous, shallower
+        one, so the principal variation of the previous search is tried first.
+        """
+        pos = state.getPacmanPosition() if agentIndex == 0 else state.getGhostPosition(agentIndex)
+        actions = sorted(actions, key=lambda action: -self.history.get((agentIndex, pos, action), 0))
+        best = self.table.action(self.table.key(state, depth, agentIndex))
+        if best is None and depth > 1:
+            best = self.table.action(self.table.key(state, depth - 1, agentIndex))
+        if best in actions:
+            actions.remove(best)
+            actions.insert(0, best)
+        return actions
+
+    def search(self, gameState, depth, deadline=None, ordered=False):
+        """
+        Searches depth rounds of moves and returns the best action, and
+        whether the search reached the end of the game on every line, in which
+        case searching deeper won't change anything.
+
+        Ordered searches sort the actions (see orderActions), and also cut off
+        on values equal to alpha or beta, which the score ties a lot. To still
+        pick an action of the best value, they only switch to another action
+        when it is strictly better.
+        """
+        complete = [True]
+
+        def minimax(state, depth, agentIndex, alpha, beta, root=False):
+            if state.isWin() or state.isLose():
                 return (None, self.evaluationFunction(state))
+            if depth == 0:
+                complete[0] = False
+                return (None, self.evaluationFunction(state))
+            if deadline is not None and time.time() > deadline:
+                raise SearchTimeout()
+            # Values outside of the window are bounds: cutoffs return them early
+            key = self.table.key(state, depth, agentIndex)
+            if not root:
+                entry = self.table.probe(key, alpha, beta, ties=ordered)
+                if entry is not None:
+                    # The stored search may have stopped short of the end of the game
+                    complete[0] = False
+                    return entry
+            window = (alpha, beta)
+            node_depth = depth
             next_agent = (agentIndex + 1) % state.getNumAgents()
             if next_agent == 0:
                 depth -= 1
             selector = max if agentIndex == 0 else min
             best_action = None
             best_score = -math.inf if agentIndex == 0 else math.inf
-            for action in state.getLegalActions(agentIndex):
+            actions = state.getLegalActions(agentIndex)
+            if ordered:
+                actions = self.orderActions(state, node_depth, agentIndex, actions)
+            for action in actions:
                 (_, score) = minimax(state.generateSuccessor(
                     agentIndex, action), depth, next_agent, alpha, beta)
-                if selector(score, best_score) == score:
+                if ordered:
+                    if best_action is None or selector(score, best_score) != best_score:
+                        best_action = action
+                        best_score = score
+                elif selector(score, best_score) == score:
                     best_action = action
                     best_score = score
                 if agentIndex == 0:
-                    if score > beta:
+                    if score > beta or (ordered and score == beta):
+                        self.table.store(key, action, score, LOWER)
+                        if ordered:
+                            self.recordCutoff(state, agentIndex, action, depth)
                         return (action, score)
                     alpha = max(alpha, score)
                 else:
-                    if score < alpha:
+                    if score < alpha or (ordered and score == alpha):
+                        self.table.store(key, action, score, UPPER)
+                        if ordered:
+                            self.recordCutoff(state, agentIndex, action, depth)
                         return (action, score)
                     beta = min(beta, score)
+            if best_score < window[0] or (ordered and best_score == window[0]):
+                self.table.store(key, best_action, best_score, UPPER)
+            elif best_score > window[1] or (ordered and best_score == window[1]):
+                self.table.store(key, best_action, best_score, LOWER)
+            else:
+                self.table.store(key, best_action, best_score, EXACT)
             return (best_action, best_score)
 
-        return minimax(gameState, self.depth, 0, -math.inf, math.inf)[0]
+        best_action = minimax(gameState, depth, 0, -math.inf, math.inf, root=True)[0]
+        return (best_action, complete[0])
+
+    def recordCutoff(self, state, agentIndex, action, depth):
+        pos = state.getPacmanPosition() if agentIndex == 0 else state.getGhostPosition(agentIndex)
+        key = (agentIndex, pos, action)
+        self.history[key] = self.history.get(key, 0) + (depth + 1) * (depth + 1)
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
     """
       Your expectimax agent (question 4)
+
+    When the evaluation function has known bounds (see EVALUATION_BOUNDS, or
+    the boundsFn agent arg), chance nodes are pruned as in Star1: once the
+    ghost moves searched so far, with the others at the upper bound, put a
+    chance node below the value Pacman is already sure of, its other moves
+    are skipped. The nodes pruned couldn't have been chosen, so the actions
+    are the same as without pruning (prune=0). expansions counts the nodes
+    expanded for the last move and total_expansions those for every move.
+
+    With workers > 1, the subtrees below the root are searched in parallel
+    (see MultiAgentSearchAgent.setWorkers). The workers don't share the
+    value Pacman is sure of at the root, so they prune less, and only the
+    nodes expanded by this process are counted.
     """
 
+    # Relative margin by which a bound must miss alpha to prune, well above
+    # the rounding errors of the averages
+    MARGIN = 1e-9
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt_size = '65536', prune = '1', boundsFn = '',
+                 workers = '1', split_ghosts = '0'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, tt_size)
+        self.setWorkers(workers, split_ghosts, evalFn=evalFn, depth=depth, tt_size=tt_size, prune=prune, boundsFn=boundsFn)
+        self.boundsFunction = None
+        if int(prune):
+            if boundsFn:
+                self.boundsFunction = util.lookup(boundsFn, globals())
+            else:
+                self.boundsFunction = EVALUATION_BOUNDS.get(self.evaluationFunction)
+        self.expansions = 0
+        self.total_expansions = 0
+        self.num_moves = 0
+
+    def expansionsPerMove(self):
+        return self.total_expansions / self.num_moves if self.num_moves > 0 else 0.0
+
+    def below(self, value, alpha):
+        return value < alpha - self.MARGIN * max(1.0, abs(alpha))
+
     def getAction(self, gameState):
         """
         Returns the expectimax action using self.depth and self.evaluationFunction
@@ -217,25 +597,201 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         """
         "*** YOUR CODE HERE ***"
 
-        def expectimax(state, depth, agentIndex):
-            if state.isWin() or state.isLose() or depth == 0:
-                return (None, self.evaluationFunction(state))
-            next_agent = (agentIndex + 1) % state.getNumAgents()
+        self.expansions = 0
+        if self.workers > 1:
+            action = self.splitRoot(gameState)
+        else:
+            action = self.expectimax(gameState, self.depth, 0, root=True)[0]
+        self.total_expansions += self.expansions
+        self.num_moves += 1
+        return action
+
+    # Searches return whether their value is exact. Values that aren't are
+    # upper bounds below the alpha they were given.
+    def expectimax(self, state, depth, agentIndex, alpha=-math.inf, root=False):
+        if state.isWin() or state.isLose() or depth == 0:
+            return (None, self.evaluationFunction(state), True)
+        key = self.table.key(state, depth, agentIndex)
+        if not root:
+            entry = self.table.probe(key, alpha)
+            if entry is not None:
+                return entry + (entry[1] >= alpha,)
+        self.expansions += 1
+        upper = math.inf
+        if self.boundsFunction is not None and alpha > -math.inf:
+            upper = self.boundsFunction(state, depth, agentIndex)[1]
+        next_agent = (agentIndex + 1) % state.getNumAgents()
+        if next_agent == 0:
+            depth -= 1
+        result_action = None
+        result_score = -math.inf if agentIndex == 0 else 0
+        exact = True
+        actions = state.getLegalActions(agentIndex)
+        num_actions = len(actions)
+        for i, action in enumerate(actions):
+            successor = state.generateSuccessor(agentIndex, action)
+            if agentIndex == 0:
+                (_, score, score_exact) = self.expectimax(successor, depth, next_agent, max(alpha, result_score))
+                if max(score, result_score) == score:
+                    result_action = action
+                    result_score = score
+                    exact = score_exact
+            else:
+                # The most the other moves can add to the average
+                rest = (num_actions - i - 1) * upper / num_actions if i < num_actions - 1 else 0
+                child_alpha = num_actions * (alpha - result_score - rest)
+                (_, score, score_exact) = self.expectimax(successor, depth, next_agent, child_alpha)
+                if not score_exact:
+                    bound = result_score + score / num_actions + rest
+                    if self.below(bound, alpha):
+                        self.table.store(key, None, bound, UPPER)
+                        return (None, bound, False)
+                    # Too close to call: search the move again for its value
+                    (_, score, score_exact) = self.expectimax(successor, depth, next_agent)
+                result_score += (score / num_actions)
+                if i < num_actions - 1 and self.below(result_score + rest, alpha):
+                    self.table.store(key, None, result_score + rest, UPPER)
+                    return (None, result_score + rest, False)
+
+        if not exact:
+            self.table.store(key, result_action, result_score, UPPER)
+            return (result_action, result_score, False)
+        self.table.store(key, result_action, result_score)
+        return (result_action, result_score, True)
+
+    def subtreeValue(self, state, depth, agentIndex):
+        return self.expectimax(state, depth, agentIndex)[1]
+
+    def ghostValue(self, values):
+        # Averaged as the search does, for the same values
+        value = 0
+        for score in values:
+            value += (score / len(values))
+        return value
+
+class MacroSearchAgent(MultiAgentSearchAgent):
+    """
+    Searches over macro moves: Pacman only chooses at junctions and dead
+    ends, and otherwise keeps walking the corridor to the next one, as the
+    successors of PacmanTree do (see junctionGraph.py). depth counts macro
+    moves, so the search sees whole corridors ahead for the nodes a single
+    step search spends on their forced moves.
+
+    The ghosts choose their first move of every macro move in the search,
+    and along the rest of the corridor make the move a DirectionalGhost most
+    likely makes. Subclasses combine the values of the ghost moves.
+    """
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt_size = '65536'):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, tt_size)
+        self.graph = None
+        self.expansions = 0
+        self.total_expansions = 0
+        self.num_moves = 0
+
+    def registerInitialState(self, state):
+        MultiAgentSearchAgent.registerInitialState(self, state)
+        self.graph = state.data.layout.getAnalysis(JunctionGraph)
+
+    def expansionsPerMove(self):
+        return self.total_expansions / self.num_moves if self.num_moves > 0 else 0.0
+
+    def macroMoves(self, state):
+        # (first action, actions along the rest of the corridor) of the moves
+        # to the next junctions or dead ends
+        x, y = state.getPacmanPosition()
+        successors = self.graph.successors_of((int(x), int(y)))
+        if not successors:
+            return [(Directions.STOP, ())]
+        return [(actions[0], tuple(actions[1:])) for (_, actions) in successors]
+
+    def ghostAction(self, state, index):
+        # The move towards Pacman, or away from him when scared, first one on ties
+        ghostState = state.getGhostState(index)
+        scared = ghostState.scaredTimer > 0
+        speed = 0.5 if scared else 1.0
+        x, y = ghostState.getPosition()
+        pacman = state.getPacmanPosition()
+        best_action = None
+        best_distance = math.inf
+        for action in state.getLegalActions(index):
+            dx, dy = Actions.directionToVector(action, speed)
+            distance = manhattanDistance((x + dx, y + dy), pacman)
+            if scared:
+                distance = -distance
+            if distance < best_distance:
+                best_action = action
+                best_distance = distance
+        return best_action
+
+    def followCorridor(self, state, actions):
+        # Pacman walks the rest of the corridor, the ghosts following ghostAction
+        for action in actions:
+            for index in range(state.getNumAgents()):
+                if state.isWin() or state.isLose():
+                    return state
+                state = state.generateSuccessor(index, action if index == 0 else self.ghostAction(state, index))
+        return state
+
+    def getAction(self, gameState):
+        """
+        Returns the first action of the best macro move using self.depth and
+        self.evaluationFunction.
+        """
+        if self.graph is None:
+            self.graph = gameState.data.layout.getAnalysis(JunctionGraph)
+        self.expansions = 0
+        action = self.search(gameState, self.depth, 0, root=True)[0]
+        self.total_expansions += self.expansions
+        self.num_moves += 1
+        return action
+
+    def search(self, state, depth, agentIndex, corridor=(), root=False):
+        # corridor holds the rest of Pacman's macro move, walked once the
+        # ghosts have chosen their first moves
+        if state.isWin() or state.isLose() or depth == 0:
+            return (None, self.evaluationFunction(state))
+        key = self.table.key(state, depth, agentIndex) + (corridor,)
+        if not root:
+            entry = self.table.probe(key)
+            if entry is not None:
+                return entry
+        self.expansions += 1
+        next_agent = (agentIndex + 1) % state.getNumAgents()
+        if agentIndex == 0:
+            moves = self.macroMoves(state)
+        else:
+            moves = [(action, corridor) for action in state.getLegalActions(agentIndex)]
+        best_action = None
+        best_score = -math.inf
+        values = []
+        for (action, rest) in moves:
+            successor = state.generateSuccessor(agentIndex, action)
             if next_agent == 0:
-                depth -= 1
-            result_action = None
-            result_score = -math.inf if agentIndex == 0 else 0
-            for action in state.getLegalActions(agentIndex):
-                (_, score) = expectimax(state.generateSuccessor(
-                    agentIndex, action), depth, next_agent)
-                if agentIndex == 0:
-                    if max(score, result_score) == score:
-                        result_action = action
-                        result_score = score
-                else:
-                    result_score += (score / len(state.getLegalActions(agentIndex)))
-                
-            return (result_action, result_score)
+                (_, score) = self.search(self.followCorridor(successor, rest), depth - 1, 0)
+            else:
+                (_, score) = self.search(successor, depth, next_agent, rest)
+            if agentIndex == 0 and max(score, best_score) == score:
+                best_action = action
+                best_score = score
+            values.append(score)
+        if agentIndex > 0:
+            best_score = self.ghostValue(values)
+        self.table.store(key, best_action, best_score)
+        return (best_action, best_score)
+
+class MacroMinimaxAgent(MacroSearchAgent):
+    """
+    Macro move minimax: every ghost chooses the first move worst for Pacman.
+    """
+
+    def ghostValue(self, values):
+        return min(values)
 
-        return expectimax(gameState, self.depth, 0)[0]
+class MacroExpectimaxAgent(MacroSearchAgent):
+    """
+    Macro move expectimax: every ghost chooses its first move uniformly at random.
+    """
 
+    def ghostValue(self, values):
+        return sum(values) / len(values)
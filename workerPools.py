@@ -0,0 +1,28 @@
+"""
+Worker processes shared by the agents that search in parallel.
+
+Pools are created once per pool size and kept for the rest of the run, so that
+process start-up is only paid once however many games and agents use them.
+"""
+
+import multiprocessing as mp
+
+worker_pools = {}
+
+
+def get_worker_pool(workers):
+    if workers not in worker_pools:
+        worker_pools[workers] = mp.Pool(workers)
+    return worker_pools[workers]
+
+
+def usable_workers(workers):
+    """
+    Returns the number of processes a search can use when asking for workers,
+    which is one inside a daemonic process (such as a pool worker) as those
+    can't start processes of their own.
+    """
+    if workers > 1 and mp.current_process().daemon:
+        print("Worker processes can't be started from a daemonic process, searching with a single process")
+        return 1
+    return workers